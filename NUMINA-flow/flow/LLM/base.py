@@ -1,18 +1,29 @@
+import asyncio
 import os
+import random
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Union, Dict
+from typing import Union, Dict, List, Optional, Set, Tuple
 
 from tqdm import tqdm
 
-from ..utils.chat_llm import chat_with_llm
+from ..utils.chat_llm import get_llm_backend
+from ..utils.llm_cache import LLMResponseCache
 from ..utils.io import (
+    JSONLShardWriter,
+    compact_jsonl_shards,
     confirm_overwrite_file,
     load_json_file_as_dict,
-    export_dict_as_json_file
+    remove_jsonl_shards
 )
 
 
+def _get_question_set_idx(question_dict: Dict) -> int:
+    return question_dict.get('question_set_idx', -1)
+
+
 class LLMBasedQRewriter(ABC):
     def __init__(
             self,
@@ -21,8 +32,14 @@ class LLMBasedQRewriter(ABC):
             llm_model: str = 'qwen2.5:72b',
             llm_backend: str = 'ollama',
             output_path: str = './output/',
+            use_llm_cache: bool = True,
+            resume: bool = False,
     ) -> None:
-        """Initialize LLM-based question generator"""
+        """Initialize LLM-based question generator
+
+        In resume mode, the outputs of a previous (interrupted) run are kept and only the questions that
+        are not rewritten yet, including the failed ones, are rewritten.
+        """
         self.question_json_file = os.path.abspath(question_json_file)
         self.question_label = os.path.splitext(os.path.basename(self.question_json_file))[0]
         self.rewrite_question_type = rewrite_question_type
@@ -30,6 +47,8 @@ class LLMBasedQRewriter(ABC):
         # configure LLM model and backend
         self.llm_model = llm_model
         self.llm_backend = llm_backend
+        # long-lived client shared by all requests (and threads) to the same model
+        self.llm_client = get_llm_backend(llm_backend, llm_model)
         print(f'Using "{llm_model}" model with "{llm_backend}" backend for rewriting the questions')
 
         # configure export path
@@ -42,10 +61,33 @@ class LLMBasedQRewriter(ABC):
         self.fail_rewrite_json_file = os.path.join(
             self.output_path, f'FAIL-{self.rewrite_question_type}-{self.question_label}.json')
 
-        if not confirm_overwrite_file(self.rewrite_json_file):
-            raise Exception(f'Aborted overwriting the existing file: {self.question_json_file}')
-        if os.path.isfile(self.fail_rewrite_json_file):
-            os.remove(self.fail_rewrite_json_file)
+        # responses are cached across runs in the output directory, so that reruns do not query the LLM again;
+        # the cache is opened for each rewrite() run
+        self.llm_cache_path = os.path.join(self.output_path, 'llm_response_cache.sqlite') if use_llm_cache else None
+        self.llm_cache: Optional[LLMResponseCache] = None
+
+        self.resume = resume
+        if self.resume:
+            # keep what an interrupted run rewrote, including the shards it left over
+            compact_jsonl_shards(self.rewrite_json_file, sort_key=_get_question_set_idx, include_unsealed=True)
+            compact_jsonl_shards(self.fail_rewrite_json_file, sort_key=_get_question_set_idx, include_unsealed=True)
+        else:
+            if not confirm_overwrite_file(self.rewrite_json_file):
+                raise Exception(f'Aborted overwriting the existing file: {self.question_json_file}')
+            if os.path.isfile(self.fail_rewrite_json_file):
+                os.remove(self.fail_rewrite_json_file)
+            # drop the shards left over by an interrupted run
+            remove_jsonl_shards(self.rewrite_json_file)
+            remove_jsonl_shards(self.fail_rewrite_json_file)
+
+    def _load_rewritten_idxs(self) -> Set[int]:
+        """Indices of the questions already in the rewrite output"""
+        if not os.path.isfile(self.rewrite_json_file) or os.path.getsize(self.rewrite_json_file) == 0:
+            return set()
+        return {
+            rewritten_dict['question_set_idx']
+            for rewritten_dict in load_json_file_as_dict(self.rewrite_json_file, is_strict=True)
+        }
 
     def rewrite(
             self,
@@ -53,43 +95,208 @@ class LLMBasedQRewriter(ABC):
             question_key: str = 'prompt',
             answer_key: str = 'caption',
             meta_keys=None,
+            concurrency: int = 1,
+            batch_size: int = 1,
     ) -> None:
-        """Rewrite the questions using the LLM model"""
+        """Rewrite the questions using the LLM model
+
+        Up to `concurrency` requests are sent at once, each retried up to `max_retries` times.
+        With a batch size above 1, each request rewrites that many questions at once, and the questions
+        failing in a batch are resubmitted individually. Results are written as they complete, tagged with
+        their "question_set_idx", and ordered by it once the run ends.
+        """
+        if concurrency < 1:
+            raise ValueError(f'Invalid concurrency: {concurrency}. Must be at least 1')
+        if batch_size < 1:
+            raise ValueError(f'Invalid batch size: {batch_size}. Must be at least 1')
+        if batch_size > 1 and type(self)._rewrite_question_batch is LLMBasedQRewriter._rewrite_question_batch:
+            raise ValueError(f'{type(self).__name__} does not support batched rewriting')
         meta_keys = meta_keys or ['scene_id', 'obj_id']
         question_dicts = load_json_file_as_dict(self.question_json_file, is_strict=True)
         print(f'Loaded {len(question_dicts)} questions from: {self.question_json_file}')
-        for idx, question_dict in tqdm(
-                enumerate(question_dicts),
-                desc='Rewriting', unit='Q', total=len(question_dicts)
-        ):
-            for attempt in range(max_retries):
-                try:
-                    rewrite_output_dict = self._rewrite_question(
-                        question_dict[question_key],
-                        question_dict[answer_key],
-                        idx
-                    )
-                    if self._validate_rewritten_question(rewrite_output_dict):
-                        merged_meta_dict = {
-                            **{key: question_dict[key] for key in meta_keys},
-                            **rewrite_output_dict.get('meta', {}),
-                        }
-                        export_dict_as_json_file({
-                            'question_set_idx': idx,
-                            'question_type': self.rewrite_question_type,
-                            'meta': merged_meta_dict,
-                            **{k: v for k, v in rewrite_output_dict.items() if k != 'meta'}
-                        }, self.rewrite_json_file)
-                    break
-                except Exception as e:
-                    print(f'[{attempt + 1}/{max_retries}] Failed to rewrite the question: {e}')
-            else:
-                print(f'Failed to rewrite the question after {max_retries} attempts')
-                export_dict_as_json_file(question_dict, self.fail_rewrite_json_file)
-
-    def _chat_with_llm(self, request_text: str) -> str:
-        """Chat with the LLM model"""
-        return chat_with_llm(request_text, self.llm_model, self.llm_backend)
+        indexed_question_dicts = list(enumerate(question_dicts))
+        if self.resume:
+            rewritten_idxs = self._load_rewritten_idxs()
+            indexed_question_dicts = [
+                (idx, question_dict) for idx, question_dict in indexed_question_dicts if idx not in rewritten_idxs
+            ]
+            # failed questions are retried, and written to the FAIL file again if they fail again
+            if os.path.isfile(self.fail_rewrite_json_file):
+                os.remove(self.fail_rewrite_json_file)
+            print(f'Resuming: skipping {len(question_dicts) - len(indexed_question_dicts)} rewritten questions, '
+                  f'{len(indexed_question_dicts)} remaining')
+        # every LLM response is costly, so the rewritten questions are appended as soon as they are validated
+        rewrite_writer = JSONLShardWriter(self.rewrite_json_file, buffer_size=1)
+        fail_rewrite_writer = JSONLShardWriter(self.fail_rewrite_json_file, buffer_size=1)
+        if self.llm_cache_path is not None:
+            self.llm_cache = LLMResponseCache(self.llm_cache_path)
+        try:
+            asyncio.run(self._rewrite_concurrently(
+                indexed_question_dicts, concurrency, rewrite_writer, fail_rewrite_writer, batch_size,
+                n_skipped=len(question_dicts) - len(indexed_question_dicts),
+                max_retries=max_retries, question_key=question_key, answer_key=answer_key, meta_keys=meta_keys
+            ))
+        finally:
+            # merge whatever was rewritten in question order, also if the run is interrupted
+            rewrite_writer.close()
+            fail_rewrite_writer.close()
+            compact_jsonl_shards(self.rewrite_json_file, sort_key=_get_question_set_idx)
+            compact_jsonl_shards(self.fail_rewrite_json_file, sort_key=_get_question_set_idx)
+            if self.llm_cache is not None:
+                print(self.llm_cache.summarize())
+                self.llm_cache.close()
+                self.llm_cache = None
+
+    async def _rewrite_concurrently(
+            self,
+            indexed_question_dicts: List[Tuple[int, Dict]],
+            concurrency: int,
+            rewrite_writer: JSONLShardWriter,
+            fail_rewrite_writer: JSONLShardWriter,
+            batch_size: int = 1,
+            n_skipped: int = 0,
+            **kwargs
+    ) -> None:
+        """Rewrite the questions with at most `concurrency` LLM requests in flight, writing them on completion
+
+        The (blocking) LLM requests run in a thread pool of the same size, while the results are written
+        from the event loop only.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        loop = asyncio.get_running_loop()
+        # skipped (already rewritten) questions count as done
+        progress_bar = tqdm(
+            desc='Rewriting', unit='Q', initial=n_skipped, total=n_skipped + len(indexed_question_dicts))
+
+        async def rewrite_batch(batch: List[Tuple[int, Dict]]) -> None:
+            async with semaphore:
+                results = await loop.run_in_executor(
+                    executor, partial(self._rewrite_batch_with_retries, batch, **kwargs))
+            for idx, question_dict, rewrite_output_dict in results:
+                if rewrite_output_dict is None:
+                    fail_rewrite_writer.append({'question_set_idx': idx, **question_dict})
+                elif rewrite_output_dict:
+                    rewrite_writer.append(rewrite_output_dict)
+            progress_bar.update(len(batch))
+
+        try:
+            await asyncio.gather(*(
+                rewrite_batch(indexed_question_dicts[start:start + batch_size])
+                for start in range(0, len(indexed_question_dicts), batch_size)
+            ))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            progress_bar.close()
+
+    def _rewrite_with_retries(
+            self,
+            idx: int,
+            question_dict: Dict,
+            max_retries: int = 5,
+            question_key: str = 'prompt',
+            answer_key: str = 'caption',
+            meta_keys=None,
+    ) -> Optional[Dict]:
+        """Rewrite a question, retrying on errors
+
+        Retries bypass the LLM response cache, as the cached response may be the one that failed.
+        Returns the rewritten question, an empty dictionary if the reply is not valid, or None if all
+        attempts failed.
+        """
+        for attempt in range(max_retries):
+            try:
+                rewrite_output_dict = self._rewrite_question(
+                    question_dict[question_key],
+                    question_dict[answer_key],
+                    idx,
+                    bypass_cache=attempt > 0
+                )
+                if not self._validate_rewritten_question(rewrite_output_dict):
+                    return {}
+                return self._merge_rewrite_output(idx, question_dict, rewrite_output_dict, meta_keys)
+            except Exception as e:
+                print(f'[{attempt + 1}/{max_retries}] Failed to rewrite the question: {e}')
+        print(f'Failed to rewrite the question after {max_retries} attempts')
+        return None
+
+    def _rewrite_batch_with_retries(
+            self,
+            batch: List[Tuple[int, Dict]],
+            max_retries: int = 5,
+            question_key: str = 'prompt',
+            answer_key: str = 'caption',
+            meta_keys=None,
+    ) -> List[Tuple[int, Dict, Optional[Dict]]]:
+        """Rewrite a batch of questions in a single request, then the failed ones individually
+
+        Each question of the batch is validated on its own. The batch request counts as the first attempt
+        of its questions, so the failed ones are retried individually up to `max_retries - 1` times.
+        Returns (index, question, result) for each question, the result being as in _rewrite_with_retries.
+        """
+        if len(batch) == 1:
+            idx, question_dict = batch[0]
+            return [(idx, question_dict, self._rewrite_with_retries(
+                idx, question_dict, max_retries, question_key, answer_key, meta_keys))]
+
+        rewrite_output_dicts = [None] * len(batch)
+        try:
+            rewrite_output_dicts = self._rewrite_question_batch([
+                (question_dict[question_key], question_dict[answer_key], idx) for idx, question_dict in batch
+            ])
+        except Exception as e:
+            print(f'Failed to rewrite the batch of {len(batch)} questions: {e}')
+
+        results = []
+        for (idx, question_dict), rewrite_output_dict in zip(batch, rewrite_output_dicts):
+            try:
+                if rewrite_output_dict is None:
+                    raise ValueError('Invalid in the batch reply')
+                results.append((idx, question_dict, self._merge_rewrite_output(
+                    idx, question_dict, rewrite_output_dict, meta_keys
+                ) if self._validate_rewritten_question(rewrite_output_dict) else {}))
+                continue
+            except Exception as e:
+                print(f'[1/{max_retries}] Failed to rewrite the question in the batch: {e}')
+            results.append((idx, question_dict, self._rewrite_with_retries(
+                idx, question_dict, max_retries - 1, question_key, answer_key, meta_keys
+            ) if max_retries > 1 else None))
+        return results
+
+    def _merge_rewrite_output(
+            self, idx: int, question_dict: Dict, rewrite_output_dict: Dict, meta_keys=None
+    ) -> Dict:
+        """Tag the rewritten question with its index and type, and merge the metadata of the source question"""
+        meta_keys = meta_keys or ['scene_id', 'obj_id']
+        merged_meta_dict = {
+            **{key: question_dict[key] for key in meta_keys},
+            **rewrite_output_dict.get('meta', {}),
+        }
+        return {
+            'question_set_idx': idx,
+            'question_type': self.rewrite_question_type,
+            'meta': merged_meta_dict,
+            **{k: v for k, v in rewrite_output_dict.items() if k != 'meta'}
+        }
+
+    def _chat_with_llm(self, request_text: str, bypass_cache: bool = False) -> str:
+        """Chat with the LLM model, through the response cache unless bypassed for a fresh sample"""
+        if self.llm_cache is None:
+            return self.llm_client.chat(request_text)
+        cache_key = LLMResponseCache.make_key(self.llm_backend, self.llm_model, request_text)
+        if bypass_cache:
+            self.llm_cache.record_bypass()
+        else:
+            response = self.llm_cache.get(cache_key)
+            if response is not None:
+                return response
+        response = self.llm_client.chat(request_text)
+        self.llm_cache.put(cache_key, response)
+        return response
+
+    def _get_question_rng(self, question_set_idx: int) -> random.Random:
+        """Random number generator of a question, so that its prompt (and cached response) is the same in reruns"""
+        return random.Random(f'{self.rewrite_question_type}:{self.question_label}:{question_set_idx}')
 
     @abstractmethod
     def _rewrite_question(
@@ -102,6 +309,18 @@ class LLMBasedQRewriter(ABC):
         """Generate a question using the LLM model"""
         pass
 
+    def _rewrite_question_batch(
+            self,
+            src_items: List[Tuple[str, str, int]],
+            **kwargs
+    ) -> List[Optional[dict[str, str | int | float]]]:
+        """Rewrite several (question, answer, question set index) in a single request
+
+        Override to support batched rewriting; returns the output of each item as _rewrite_question,
+        or None for the items invalid in the reply.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def _validate_rewritten_question(
             self,
@@ -1,12 +1,13 @@
-import random
-from typing import Union, Dict
+from typing import Union, Dict, List, Optional, Tuple
 
 from .base import LLMBasedQRewriter
-from ..utils.io import parse_json_text
+from ..utils.io import parse_json_array_text, parse_json_text
 
 
 class FactValidationRewriter(LLMBasedQRewriter):
     """Fact validation (True/False question) generator implementation"""
+    AFFIRMATIVE_WORDS = ['yes', 'true', 'correct', 'agree']
+    NEGATIVE_WORDS = ['no', 'false', 'incorrect', 'disagree']
 
     def __init__(
             self,
@@ -22,7 +23,9 @@ class FactValidationRewriter(LLMBasedQRewriter):
             rewrite_question_type='LLM_rewrite-FV',
             llm_model=kwargs.get('llm_model', 'qwen2.5:72b'),
             llm_backend=kwargs.get('llm_backend', 'ollama'),
-            output_path=kwargs.get('output_path', './output/')
+            output_path=kwargs.get('output_path', './output/'),
+            use_llm_cache=kwargs.get('use_llm_cache', True),
+            resume=kwargs.get('resume', False)
         )
 
     def _rewrite_question(
@@ -35,16 +38,7 @@ class FactValidationRewriter(LLMBasedQRewriter):
         """Rewrite the question as a true/false question"""
         # cleanup answer text
         src_answer_cleanup = src_answer.rstrip('.').strip()
-        # generate rewrite caption
-        if self.enforce_balanced_boolean:
-            preset_rewritten_boolean = True if question_set_idx % 2 == 0 else False
-        else:
-            preset_rewritten_boolean = random.choice([True, False])
-
-        affirmative_words = ['yes', 'true', 'correct', 'agree']
-        negative_words = ['no', 'false', 'incorrect', 'disagree']
-        # choose from pairs of words
-        affirmative_word, negative_word = random.choice([*zip(affirmative_words, negative_words)])
+        preset_rewritten_boolean, affirmative_word, negative_word = self._get_presets(question_set_idx)
 
         # generate the LLM prompt
         llm_prompt = str(
@@ -88,8 +82,108 @@ class FactValidationRewriter(LLMBasedQRewriter):
 
         # get the rewritten question from the LLM model
         rewritten_question_dict = parse_json_text(
-            self._chat_with_llm(llm_prompt), ['prompt', 'caption', 'cp_prompt', 'cp_caption'])
+            self._chat_with_llm(llm_prompt, kwargs.get('bypass_cache', False)),
+            ['prompt', 'caption', 'cp_prompt', 'cp_caption'])
+
+        return self._form_rewrite_output(
+            src_question, src_answer, rewritten_question_dict,
+            preset_rewritten_boolean, affirmative_word, negative_word
+        )
+
+    def _rewrite_question_batch(
+            self,
+            src_items: List[Tuple[str, str, int]],
+            **kwargs
+    ) -> List[Optional[dict[str, Union[str, int, float]]]]:
+        """Rewrite several questions as true/false questions in a single request"""
+        presets = [self._get_presets(question_set_idx) for _, _, question_set_idx in src_items]
+        input_text = ''.join(
+            f'[{item_idx + 1}]\n'
+            f' - Original SAQ: "{src_question}"\n'
+            f' - Original Answer: "{src_answer.rstrip(".").strip()}"\n'
+            f' - Boolean Indicator: {preset_rewritten_boolean}\n'
+            f' - Answer Options: "{affirmative_word}" (for True) / "{negative_word}" (for False)\n'
+            for item_idx, ((src_question, src_answer, _), (preset_rewritten_boolean, affirmative_word, negative_word))
+            in enumerate(zip(src_items, presets))
+        )
+
+        # generate the LLM prompt, with the instructions and the example only once for all questions
+        llm_prompt = str(
+            f'<Introduction>\n'
+            f'Please rewrite each of the following {len(src_items)} Short Answer Questions (SAQs) into a '
+            f'True/False Question (TFQ) format, and also produce its contrapositive version.\n\n'
+            f'<Inputs>\n'
+            f'{input_text}\n'
+            f'<Task Description>\n'
+            f'For each input:\n'
+            f'1. Convert the SAQ into a clear, factual statement incorporating the given answer.\n'
+            f'2. Rewrite the statement into a TFQ based on its Boolean Indicator:\n'
+            f'   - If True → Keep the statement affirmative (e.g., "Bob sits next to Alice.")\n'
+            f'   - If False → Negate the statement (e.g., "Bob does not sit next to Alice.")\n'
+            f'3. Append its answer options at the end as: '
+            f'"Is this correct? Answer with <option for True> or <option for False>."\n'
+            f'4. Generate the contrapositive TFQ by logically inverting the original statement while keeping the same answer options.\n'
+            f'5. Ensure that both TFQs are logically and grammatically correct.\n\n'
+            f'<Output>\n'
+            f'Return only a JSON array with one object per input, in the same order, each with exactly these keys:\n'
+            f'  - \"prompt\": the rewritten TFQ\n'
+            f'  - \"caption\": the answer option corresponding to the preset boolean indicator\n'
+            f'  - \"cp_prompt\": the contrapositive version of the rewritten TFQ\n'
+            f'  - \"cp_caption\": the answer option corresponding to the negation of the preset boolean indicator\n'
+            f'Do not include any additional text or explanation outside this JSON array.\n\n'
+            f'<Example>\n'
+            f'Input:\n'
+            f'[1]\n'
+            f' - Original SAQ: "Who sits next to Alice?"\n'
+            f' - Original Answer: "Bob"\n'
+            f' - Boolean Indicator: False\n'
+            f' - Answer Options: "yes" (for True) / "no" (for False)\n\n'
+            f'A valid output would be:\n'
+            f'[\n'
+            f'  {{\n'
+            f'    "prompt": "Bob does not sit next to Alice. Is this correct? Answer with yes or no.",\n'
+            f'    "caption": "no",\n'
+            f'    "cp_prompt": "Bob sits next to Alice. Is this correct? Answer with yes or no.",\n'
+            f'    "cp_caption": "yes"\n'
+            f'  }}\n'
+            f']'
+        )
+
+        # get the rewritten questions from the LLM model, None for those invalid in the reply
+        rewritten_question_dicts = parse_json_array_text(
+            self._chat_with_llm(llm_prompt, kwargs.get('bypass_cache', False)),
+            ['prompt', 'caption', 'cp_prompt', 'cp_caption'], len(src_items))
 
+        return [
+            self._form_rewrite_output(src_question, src_answer, rewritten_question_dict, *item_presets)
+            if rewritten_question_dict is not None else None
+            for (src_question, src_answer, _), rewritten_question_dict, item_presets
+            in zip(src_items, rewritten_question_dicts, presets)
+        ]
+
+    def _get_presets(self, question_set_idx: int) -> Tuple[bool, str, str]:
+        """Preset boolean and answer words (affirmative, negative) of a question"""
+        rng = self._get_question_rng(question_set_idx)
+        # generate rewrite caption
+        if self.enforce_balanced_boolean:
+            preset_rewritten_boolean = True if question_set_idx % 2 == 0 else False
+        else:
+            preset_rewritten_boolean = rng.choice([True, False])
+        # choose from pairs of words
+        affirmative_word, negative_word = rng.choice([*zip(self.AFFIRMATIVE_WORDS, self.NEGATIVE_WORDS)])
+        return preset_rewritten_boolean, affirmative_word, negative_word
+
+    def _form_rewrite_output(
+            self,
+            src_question: str,
+            src_answer: str,
+            rewritten_question_dict: Dict[str, str],
+            preset_rewritten_boolean: bool,
+            affirmative_word: str,
+            negative_word: str,
+    ) -> dict[str, Union[str, int, float]]:
+        """Form the rewrite output of a question from the LLM reply and its presets"""
+        affirmative_words, negative_words = list(self.AFFIRMATIVE_WORDS), list(self.NEGATIVE_WORDS)
         return {
             'meta': {
                 'src_prompt': src_question,
@@ -1,10 +1,9 @@
-import random
 import re
 import string
-from typing import Union, Dict
+from typing import Union, Dict, List, Optional, Tuple
 
 from .base import LLMBasedQRewriter
-from ..utils.io import parse_json_text
+from ..utils.io import parse_json_array_text, parse_json_text
 
 
 class PromptMatchingRewriter(LLMBasedQRewriter):
@@ -28,7 +27,9 @@ class PromptMatchingRewriter(LLMBasedQRewriter):
             rewrite_question_type='LLM_rewrite-PM',
             llm_model=kwargs.get('llm_model', 'qwen2.5:72b'),
             llm_backend=kwargs.get('llm_backend', 'ollama'),
-            output_path=kwargs.get('output_path', './output/')
+            output_path=kwargs.get('output_path', './output/'),
+            use_llm_cache=kwargs.get('use_llm_cache', True),
+            resume=kwargs.get('resume', False)
         )
 
     def _rewrite_question(
@@ -41,11 +42,7 @@ class PromptMatchingRewriter(LLMBasedQRewriter):
         """Rewrite the question as a multiple-choice question"""
         # cleanup answer text
         src_answer_cleanup = src_answer.rstrip('.').strip()
-        # generate rewrite caption
-        if self.is_evenly_shuffled_options:
-            preset_rewritten_option = string.ascii_uppercase[question_set_idx % self.n_options]
-        else:
-            preset_rewritten_option = random.choice(string.ascii_uppercase[:self.n_options])
+        preset_rewritten_option = self._get_preset_option(question_set_idx)
 
         # generate the LLM prompt
         llm_prompt = str(
@@ -90,8 +87,96 @@ class PromptMatchingRewriter(LLMBasedQRewriter):
         )
         # get the rewritten question from the LLM model
         rewritten_question_dict = parse_json_text(
-            self._chat_with_llm(llm_prompt), ['prompt', 'caption'])
+            self._chat_with_llm(llm_prompt, kwargs.get('bypass_cache', False)), ['prompt', 'caption'])
+
+        return self._form_rewrite_output(src_question, src_answer, rewritten_question_dict, preset_rewritten_option)
+
+    def _rewrite_question_batch(
+            self,
+            src_items: List[Tuple[str, str, int]],
+            **kwargs
+    ) -> List[Optional[dict[str, Union[str, int, float]]]]:
+        """Rewrite several questions as multiple-choice questions in a single request"""
+        preset_options = [self._get_preset_option(question_set_idx) for _, _, question_set_idx in src_items]
+        input_text = ''.join(
+            f'[{item_idx + 1}]\n'
+            f' - Original SAQ: "{src_question}"\n'
+            f' - Original Answer: "{src_answer.rstrip(".").strip()}"\n'
+            f' - Expected Correct Option: {preset_rewritten_option}\n'
+            f' - Number of Options: {self.n_options}\n'
+            for item_idx, ((src_question, src_answer, _), preset_rewritten_option)
+            in enumerate(zip(src_items, preset_options))
+        )
+
+        # generate the LLM prompt, with the instructions and the example only once for all questions
+        llm_prompt = str(
+            f'<Introduction>\n'
+            f'Please rewrite each of the following {len(src_items)} Short Answer Questions (SAQs) into a '
+            f'multiple-choice question (MCQ) format with {self.n_options} options\n\n'
+            f'<Inputs>\n'
+            f'{input_text}\n'
+            f'<Task Description>\n'
+            f'For each input:\n'
+            f'1. Convert the SAQ into a clear and concise MCQ format.\n'
+            f'2. Generate {self.n_options - 1} incorrect options as distractors:\n'
+            f'   - Keep them the same type as the correct answer '
+            f'     (e.g., if the answer is a noun, distractors should also be nouns).\n'
+            f'   - Ensure all options are plausible but incorrect.\n'
+            f'   - Avoid synonyms, too obvious wrong choices, or options that give away the answer.\n'
+            f'3. Ensure that the correct answer is placed exactly as provided '
+            f'   (including spelling mistakes) at the correct option label.\n'
+            f'4. Format the options as follows:\n'
+            f'   - "A) Option_A  B) Option_B  C) Option_C ..."\n'
+            f'   - Ensure the correct answer is placed at the provided correct option label.\n'
+            f'5. Insert a answering hint, suggesting to answer with the correct option letter.\n\n'
+            f'<Output>\n'
+            f'Return only a JSON array with one object per input, in the same order, each with exactly these keys:\n'
+            f'  - \"prompt\": the rewritten MCQ\n'
+            f'  - \"caption\": the correct option label (e.g., "A")\n'
+            f'Do not include any additional text or explanation outside this JSON array.\n\n'
+            f'<Example>\n'
+            f'Input (Note: The original answer misspells "Paris" as "Parris"):\n'
+            f'[1]\n'
+            f' - Original SAQ: "What is the capital of France?"\n'
+            f' - Original Answer: "Parris"\n'
+            f' - Expected Correct Option: B\n'
+            f' - Number of Options: 4\n\n'
+            f'A valid output would be:\n'
+            f'[\n'
+            f'  {{\n'
+            f'    "prompt": "What is the capital of France? Answer the question with the correct option letter.'
+            f' A) Berlin B) Parris C) London D) Rome",\n'
+            f'    "caption": "B"\n'
+            f'  }}\n'
+            f']'
+        )
+
+        # get the rewritten questions from the LLM model, None for those invalid in the reply
+        rewritten_question_dicts = parse_json_array_text(
+            self._chat_with_llm(llm_prompt, kwargs.get('bypass_cache', False)), ['prompt', 'caption'], len(src_items))
+
+        return [
+            self._form_rewrite_output(src_question, src_answer, rewritten_question_dict, preset_rewritten_option)
+            if rewritten_question_dict is not None else None
+            for (src_question, src_answer, _), rewritten_question_dict, preset_rewritten_option
+            in zip(src_items, rewritten_question_dicts, preset_options)
+        ]
+
+    def _get_preset_option(self, question_set_idx: int) -> str:
+        """Preset label of the correct option of a question"""
+        # generate rewrite caption
+        if self.is_evenly_shuffled_options:
+            return string.ascii_uppercase[question_set_idx % self.n_options]
+        return self._get_question_rng(question_set_idx).choice(string.ascii_uppercase[:self.n_options])
 
+    def _form_rewrite_output(
+            self,
+            src_question: str,
+            src_answer: str,
+            rewritten_question_dict: Dict[str, str],
+            preset_rewritten_option: str,
+    ) -> dict[str, Union[str, int, float]]:
+        """Form the rewrite output of a question from the LLM reply and its preset option"""
         return {
             'meta': {
                 'src_prompt': src_question,
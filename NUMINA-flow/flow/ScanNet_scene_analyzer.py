@@ -1,17 +1,33 @@
 import json
 import os
+import shutil
+import time
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, List
 
 import click
 import numpy as np
-from joblib import delayed
-from plyfile import PlyData
-from scipy.spatial import distance, ConvexHull
+from joblib import delayed, effective_n_jobs
 
-from .utils.io import export_dict_as_json_file
-from .utils.parallel import ParallelTqdm
+from .utils.geometry import SurfaceDistanceEngine, build_hull_vertices
+from .utils.columnar import export_scene_stats_as_npz_file
+from .utils.io import export_json_file_atomically
+from .utils.manifest import SceneManifest
+from .utils.parallel import ParallelTqdm, summarize_worker_utilisation
+from .utils.profiling import (
+    PROFILE_REPORT_FORMATS, StageProfiler, export_profile_report, summarize_profile
+)
+from .utils.ply import count_ply_vertices, read_ply_vertices, vertex_fields_as_array
+from .utils.shared import SharedArray
+
+
+# bump whenever a change to the analysis alters the exported scene statistics
+ANALYZER_VERSION = '1.0'
+# subdirectory of the export directory holding the per-scene manifest entries
+MANIFEST_DIR_NAME = '.manifest'
+# supported export formats of the scene statistics
+EXPORT_FORMATS = ['json', 'npz']
 
 
 @dataclass
@@ -51,10 +67,57 @@ class SceneInstanceMetric:
             print(f'Error calculating metrics for object {self.object_id}: {e}')
 
 
+@dataclass(frozen=True)
+class SharedSceneInstances:
+    """Instance points of a scene in one shared float32 buffer, with the instances as contiguous row slices
+
+    Points are stored in float32, the precision of ScanNet PLY vertices, so that results are identical to
+    analyzing the PLY file itself (for PLY files with double vertices, coordinates are rounded to float32,
+    i.e. a relative error below 1e-7). The convex hull vertices of the instances are built once from these
+    points and shared the same way, an instance without a hull being an empty slice with its error.
+    """
+    points: SharedArray
+    offsets: tuple[int, ...]
+    object_ids: tuple
+    labels: tuple[str, ...]
+    n_vertices: int
+    hull_vertices: SharedArray
+    hull_offsets: tuple[int, ...]
+    hull_errors: dict[int, str]
+
+    def unlink(self) -> None:
+        self.points.unlink()
+        self.hull_vertices.unlink()
+
+
 class ScanNetSceneAnalyzer:
-    def __init__(self, scene_dir: str) -> None:
+    ASSIGN_MODES = ['lookup', 'mask']
+
+    def __init__(
+            self, scene_dir: str, assign_mode: str = 'lookup', distance_mode: str = 'vertex',
+            graph_radius: Optional[float] = None, graph_k: Optional[int] = None
+    ) -> None:
         self.scene_dir = Path(scene_dir).absolute()
         self.scene_id = self.scene_dir.name
+        if assign_mode not in self.ASSIGN_MODES:
+            raise ValueError(f'Invalid assign mode: {assign_mode}. Must be one of {self.ASSIGN_MODES}')
+        self.assign_mode = assign_mode
+        if distance_mode not in SurfaceDistanceEngine.DISTANCE_MODES:
+            raise ValueError(f'Invalid distance mode: {distance_mode}. '
+                             f'Must be one of {SurfaceDistanceEngine.DISTANCE_MODES}')
+        self.distance_mode = distance_mode
+        # only keep pairs within the radius and/or each object's k nearest neighbours, if given
+        if graph_radius is not None and graph_radius < 0:
+            raise ValueError(f'Invalid graph radius: {graph_radius}. Must be non-negative')
+        if graph_k is not None and graph_k < 1:
+            raise ValueError(f'Invalid graph k: {graph_k}. Must be positive')
+        self.graph_radius = graph_radius
+        self.graph_k = graph_k
+        self._instances: Optional[List[SceneInstanceMetric]] = None
+        self._distance_engine: Optional[SurfaceDistanceEngine] = None
+        self._shared_instances: Optional[SharedSceneInstances] = None
+        # per-stage timing of the analysis, disabled unless replaced by an enabled profiler
+        self.profiler = StageProfiler(enabled=False)
         # validate if the scene directory exists
         if not self.scene_dir.is_dir():
             raise FileNotFoundError(f'Invalid scene directory path: {self.scene_dir}')
@@ -66,66 +129,244 @@ class ScanNetSceneAnalyzer:
         self.agg_json_path = self.scene_dir / f'{self.scene_id}_vh_clean.aggregation.json'
         # self.agg_json_path = self.scene_dir / f'{self.scene_id}.aggregation.json'
 
-        for scene_file_path in [self.ply_path, self.seg_json_path, self.agg_json_path]:
+        for scene_file_path in self.input_paths:
             if not scene_file_path.exists():
                 raise FileNotFoundError(f'Missing scene file: {scene_file_path}')
 
+    @property
+    def input_paths(self) -> List[Path]:
+        """Scene files the analysis depends on"""
+        return [self.ply_path, self.seg_json_path, self.agg_json_path]
+
+    @property
+    def is_sparse(self) -> bool:
+        """Whether only a neighbour graph of the pairwise distances is computed"""
+        return self.graph_radius is not None or self.graph_k is not None
+
+    @property
+    def version(self) -> dict[str, str]:
+        """Analyzer version and the options affecting the exported scene statistics"""
+        version = {'analyzer': ANALYZER_VERSION, 'distance_mode': self.distance_mode}
+        if self.is_sparse:
+            version['distance_graph'] = f'radius={self.graph_radius},k={self.graph_k}'
+        return version
+
     def _load_point_cloud(self) -> np.ndarray:
         """Load point cloud data from PLY file"""
-        vertices = PlyData.read(str(self.ply_path))['vertex']
-        return np.vstack([vertices['x'], vertices['y'], vertices['z']]).T
+        return vertex_fields_as_array(read_ply_vertices(self.ply_path), ('x', 'y', 'z'))
+
+    @staticmethod
+    def _group_points_by_mask(
+            points: np.ndarray, seg_indices: np.ndarray, seg_groups: List[dict]
+    ) -> List[np.ndarray]:
+        """Collect the points of each segment group with one boolean mask per group"""
+        return [points[np.isin(seg_indices, group['segments'])] for group in seg_groups]
+
+    @staticmethod
+    def _group_points_by_lookup(
+            points: np.ndarray, seg_indices: np.ndarray, seg_groups: List[dict]
+    ) -> List[np.ndarray]:
+        """Collect the points of each segment group with a single segment-to-group lookup"""
+        n_lookup = max(
+            int(seg_indices.max(initial=-1)),
+            max((max(group['segments'], default=-1) for group in seg_groups), default=-1)
+        ) + 1
+        seg_to_group = np.full(n_lookup, -1, dtype=np.int64)
+        # groups sharing segments with another group cannot be resolved by the lookup table
+        shared_group_idxs = set()
+        for group_idx, group in enumerate(seg_groups):
+            segments = np.asarray(group['segments'], dtype=np.int64)
+            claimed_idxs = np.unique(seg_to_group[segments])
+            claimed_idxs = claimed_idxs[claimed_idxs >= 0]
+            if len(claimed_idxs) > 0:
+                shared_group_idxs.update(claimed_idxs.tolist() + [group_idx])
+            seg_to_group[segments[seg_to_group[segments] < 0]] = group_idx
+
+        # label every vertex in one gather, then sort the vertices into contiguous per-group slices
+        # (stable sort keeps the original vertex order within each group, same as boolean masking)
+        vertex_groups = seg_to_group[seg_indices]
+        order = np.argsort(vertex_groups, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(vertex_groups + 1, minlength=len(seg_groups) + 1))])
+        sorted_points = points[order]
+
+        return [
+            points[np.isin(seg_indices, group['segments'])]
+            if group_idx in shared_group_idxs else
+            sorted_points[offsets[group_idx + 1]:offsets[group_idx + 2]]
+            for group_idx, group in enumerate(seg_groups)
+        ]
+
+    def share_instances(self, shared_dir: Optional[str] = None) -> SharedSceneInstances:
+        """Load the instance points and build their convex hulls once, into shared buffers that worker
+        processes can attach to zero-copy"""
+        instances = self._init_instance(calc_metrics=False)
+        points = np.concatenate([inst.points for inst in instances]) if instances else np.empty((0, 3))
+        offsets = tuple(np.cumsum([0] + [len(inst.points) for inst in instances]).tolist())
+        shared_points = SharedArray.create(points, shared_dir, dtype='float32')
+        try:
+            # the hulls are built from the shared points, so that they are the same as those built by a worker
+            attached_points = shared_points.attach()
+            with self.profiler.stage('build_hulls'):
+                hull_vertices, hull_errors = build_hull_vertices(
+                    [attached_points[offsets[idx]:offsets[idx + 1]] for idx in range(len(instances))])
+            shared_hull_vertices = SharedArray.create(
+                np.concatenate([v for v in hull_vertices if v is not None] or [np.empty((0, 3))]),
+                shared_dir, dtype='float32'
+            )
+        except Exception:
+            shared_points.unlink()
+            raise
+        return SharedSceneInstances(
+            points=shared_points,
+            offsets=offsets,
+            object_ids=tuple(inst.object_id for inst in instances),
+            labels=tuple(inst.label for inst in instances),
+            n_vertices=count_ply_vertices(self.ply_path),
+            hull_vertices=shared_hull_vertices,
+            hull_offsets=tuple(np.cumsum([0] + [len(v) if v is not None else 0 for v in hull_vertices]).tolist()),
+            hull_errors=hull_errors,
+        )
 
-    def _init_instance(self) -> List[SceneInstanceMetric]:
+    def attach_shared_instances(self, shared_instances: SharedSceneInstances) -> None:
+        """Take the instances from a shared buffer instead of the scene files"""
+        self._shared_instances = shared_instances
+
+    def _init_shared_instance(self) -> List[SceneInstanceMetric]:
+        """Create the instances as views into the attached shared buffer"""
+        points = self._shared_instances.points.attach()
+        offsets = self._shared_instances.offsets
+        return [
+            SceneInstanceMetric(object_id=object_id, label=label, points=points[offsets[idx]:offsets[idx + 1]])
+            for idx, (object_id, label) in enumerate(zip(self._shared_instances.object_ids,
+                                                         self._shared_instances.labels))
+        ]
+
+    def _init_instance(self, calc_metrics: bool = True) -> List[SceneInstanceMetric]:
         """Convert point cloud into instances"""
-        points = self._load_point_cloud()
-
-        with self.seg_json_path.open() as f:
-            seg_indices = np.array(json.load(f)['segIndices'])
-
-        with self.agg_json_path.open() as f:
-            agg_data = json.load(f)
-
-        instances = []
-        for group in agg_data['segGroups']:
-            idx_mask = np.isin(seg_indices, group['segments'])
-            if np.any(idx_mask):
-                instance = SceneInstanceMetric(
-                    object_id=group['objectId'],
-                    label=group['label'],
-                    points=points[idx_mask]
+        if self._shared_instances is not None:
+            with self.profiler.stage('attach_shared'):
+                instances = self._init_shared_instance()
+            self.profiler.count(n_vertices=self._shared_instances.n_vertices)
+        else:
+            with self.profiler.stage('load_ply'):
+                points = self._load_point_cloud()
+
+            with self.profiler.stage('parse_json'):
+                with self.seg_json_path.open() as f:
+                    seg_indices = np.array(json.load(f)['segIndices'])
+
+                with self.agg_json_path.open() as f:
+                    agg_data = json.load(f)
+
+            with self.profiler.stage('group_instances'):
+                group_points = (
+                    self._group_points_by_lookup(points, seg_indices, agg_data['segGroups'])
+                    if self.assign_mode == 'lookup' else
+                    self._group_points_by_mask(points, seg_indices, agg_data['segGroups'])
                 )
-                instance.calc_metrics()
-                instances.append(instance)
+
+                instances = []
+                for group, inst_points in zip(agg_data['segGroups'], group_points):
+                    if len(inst_points) > 0:
+                        instances.append(SceneInstanceMetric(
+                            object_id=group['objectId'],
+                            label=group['label'],
+                            points=inst_points
+                        ))
+            self.profiler.count(n_vertices=len(points))
+        self.profiler.count(n_instances=len(instances))
+
+        if calc_metrics:
+            with self.profiler.stage('calc_metrics'):
+                for instance in instances:
+                    instance.calc_metrics()
 
         return instances
 
-    @staticmethod
-    def _calc_pairwise_distances(instances: List[SceneInstanceMetric]) -> dict[str, float]:
-        """Calculate the pairwise distances between the object centers"""
-        distance_dict = {}
-        for idx, inst1 in enumerate(instances):
-            for inst2 in instances[idx + 1:]:
-                try:
-                    # the nearest distance between the surface of two objects
-                    hull1 = ConvexHull(inst1.points)
-                    hull2 = ConvexHull(inst2.points)
-                    distance_dict[f'{inst1.object_id}-{inst2.object_id}'] = float(
-                        np.min(distance.cdist(
-                            inst1.points[hull1.vertices],
-                            inst2.points[hull2.vertices],
-                            'euclidean'
-                        )))
-                except Exception as e:
-                    print(f'Error calculating distance between {inst1.object_id} and {inst2.object_id}: {e}')
-                    continue
-
-        return distance_dict
-
-    def analyze(self) -> dict[str, any]:
-        """Analyze the ScanNet scene and return the scene statistics"""
+    def _init_distance_engine(self, instances: List[SceneInstanceMetric], verbose: bool = True) -> None:
+        """Build the convex hulls of the instances for surface distance calculation"""
+        # the nearest distance between the surface (convex hull) of two objects
+        self._instances = instances
+        if self._shared_instances is not None:
+            with self.profiler.stage('attach_hulls'):
+                self._distance_engine = self._init_shared_distance_engine()
+        else:
+            with self.profiler.stage('build_hulls'):
+                self._distance_engine = SurfaceDistanceEngine(
+                    [inst.points for inst in instances], mode=self.distance_mode)
+        for idx, error in self._distance_engine.hull_errors.items() if verbose else []:
+            print(f'Error calculating convex hull of {instances[idx].object_id}: {error}')
+
+    def _init_shared_distance_engine(self) -> SurfaceDistanceEngine:
+        """Create the distance engine over the convex hulls in the attached shared buffer"""
+        hull_vertices = self._shared_instances.hull_vertices.attach()
+        hull_offsets = self._shared_instances.hull_offsets
+        hull_errors = self._shared_instances.hull_errors
+        return SurfaceDistanceEngine.from_hull_vertices(
+            [
+                hull_vertices[hull_offsets[idx]:hull_offsets[idx + 1]] if idx not in hull_errors else None
+                for idx in range(len(hull_offsets) - 1)
+            ],
+            hull_errors, mode=self.distance_mode
+        )
+
+    def _calc_pairwise_distances(self, instances: List[SceneInstanceMetric]) -> dict[str, float]:
+        """Calculate the pairwise distances between the object surfaces"""
+        self._init_distance_engine(instances)
+        with self.profiler.stage('calc_distances'):
+            pairwise_distances = (
+                self._distance_engine.neighbor_graph(self.graph_radius, self.graph_k)
+                if self.is_sparse else
+                self._distance_engine.pairwise_distances()
+            )
+        self.profiler.count(n_pairs=len(pairwise_distances))
+        return {
+            f'{instances[idx1].object_id}-{instances[idx2].object_id}': dist
+            for (idx1, idx2), dist in pairwise_distances.items()
+        }
+
+    def calc_pairwise_distance_block(self, block_idx: int, n_blocks: int) -> dict[str, float]:
+        """Calculate one of n_blocks interleaved blocks of the pairwise distances, for splitting across workers"""
+        instances = self._init_instance(calc_metrics=False)
+        # hull errors are reported by the first block only
+        self._init_distance_engine(instances, verbose=block_idx == 0)
+        with self.profiler.stage('calc_distances'):
+            pairwise_distances = self._distance_engine.pairwise_distances(range(block_idx, len(instances), n_blocks))
+        self.profiler.count(n_pairs=len(pairwise_distances))
+        return {
+            f'{instances[idx1].object_id}-{instances[idx2].object_id}': dist
+            for (idx1, idx2), dist in pairwise_distances.items()
+        }
+
+    def calc_pairwise_distance(self, obj_id1: str | int, obj_id2: str | int) -> float:
+        """Calculate the distance between two objects on demand (e.g., for pairs left out of a neighbour graph)"""
+        if self._distance_engine is None:
+            self._init_distance_engine(self._init_instance())
+        id_to_idx = {str(inst.object_id): idx for idx, inst in enumerate(self._instances)}
+        for obj_id in (obj_id1, obj_id2):
+            if str(obj_id) not in id_to_idx:
+                raise ValueError(f'Object ID "{obj_id}" not found in scene {self.scene_id}')
+        return self._distance_engine.distance(id_to_idx[str(obj_id1)], id_to_idx[str(obj_id2)])
+
+    def analyze(self, pairwise_distances: Optional[dict[str, float]] = None) -> dict[str, any]:
+        """Analyze the ScanNet scene and return the scene statistics
+
+        Pairwise distances calculated beforehand (e.g., in blocks across workers) can be passed in.
+        """
         instances = self._init_instance()
-        pairwise_distance_dict = self._calc_pairwise_distances(instances)
+        pairwise_distance_dict = (
+            pairwise_distances if pairwise_distances is not None else
+            self._calc_pairwise_distances(instances)
+        )
+        self.profiler.count(n_pairs=len(pairwise_distance_dict))
+
+        with self.profiler.stage('assemble_stats'):
+            scene_stats = self._assemble_scene_stats(instances, pairwise_distance_dict)
+        return scene_stats
 
+    def _assemble_scene_stats(
+            self, instances: List[SceneInstanceMetric], pairwise_distance_dict: dict[str, float]
+    ) -> dict[str, any]:
         scene_stats = {
             'scene_id': self.scene_id,
             'num_instances': len(instances),
@@ -159,21 +400,112 @@ class ScanNetSceneAnalyzer:
                 key=lambda item: tuple(map(int, item[0].split('-')))
             ))
         }
+        if self.is_sparse:
+            # settings of the neighbour graph, so that missing pairs can be calculated on demand
+            scene_stats['pairwise_distance_graph'] = {
+                'radius': self.graph_radius,
+                'k': self.graph_k,
+                'distance_mode': self.distance_mode,
+                'scene_dir': str(self.scene_dir),
+            }
 
         return scene_stats
 
 
-def process_scene(scene_dir: str, export_dir: str, export_prefix: str) -> None:
+def _get_export_paths(
+        export_dir: str, export_prefix: str, scene_id: str, export_formats: tuple[str, ...]
+) -> dict[str, str]:
+    return {
+        export_format: os.path.join(export_dir, f'{export_prefix}-{scene_id}.{export_format}')
+        for export_format in export_formats
+    }
+
+
+def is_scene_up_to_date(
+        scene_dir: str, export_dir: str, export_prefix: str,
+        export_formats: tuple[str, ...] = ('json',), analyzer_kwargs: Optional[dict] = None
+) -> bool:
+    """Check whether the exported statistics of a scene are still valid for its current input files"""
     try:
-        analyzer = ScanNetSceneAnalyzer(scene_dir)
-        scene_stats = analyzer.analyze()
+        analyzer = ScanNetSceneAnalyzer(scene_dir, **(analyzer_kwargs or {}))
+    except FileNotFoundError:
+        return False
+    return SceneManifest(os.path.join(export_dir, MANIFEST_DIR_NAME)).is_up_to_date(
+        analyzer.scene_id, analyzer.input_paths,
+        list(_get_export_paths(export_dir, export_prefix, analyzer.scene_id, export_formats).values()),
+        analyzer.version
+    )
 
-        export_dict_as_json_file(
-            scene_stats,
-            os.path.join(export_dir, f'{export_prefix}-{analyzer.scene_id}.json')
-        )
+
+def estimate_scene_size(scene_dir: str) -> int:
+    """Estimate the analysis cost of a scene by the number of vertices (or the size) of its PLY file"""
+    ply_path = Path(scene_dir) / f'{Path(scene_dir).name}_vh_clean_2.ply'
+    try:
+        return count_ply_vertices(ply_path)
+    except Exception:
+        return os.path.getsize(ply_path) if ply_path.is_file() else 0
+
+
+def _task_record(
+        task: str, scene_dir: str, start_time: float, profiler: Optional[StageProfiler] = None
+) -> dict[str, any]:
+    scene_id, worker = Path(scene_dir).name, os.getpid()
+    return {
+        'task': task, 'scene_id': scene_id,
+        'worker': worker, 'start_time': start_time, 'end_time': time.time(),
+        'stages': profiler.to_rows(scene_id=scene_id, task=task, worker=worker) if profiler is not None else [],
+    }
+
+
+def process_scene(
+        scene_dir: str, export_dir: str, export_prefix: str,
+        export_formats: tuple[str, ...] = ('json',), analyzer_kwargs: Optional[dict] = None,
+        pairwise_distances: Optional[dict[str, float]] = None, shared_instances: Optional[SharedSceneInstances] = None,
+        profile: bool = False
+) -> dict[str, any]:
+    start_time = time.time()
+    profiler = StageProfiler(enabled=profile)
+    try:
+        analyzer = ScanNetSceneAnalyzer(scene_dir, **(analyzer_kwargs or {}))
+        analyzer.profiler = profiler
+        if shared_instances is not None:
+            analyzer.attach_shared_instances(shared_instances)
+        # fingerprint the inputs before analysis, so that files modified meanwhile are reanalyzed next time
+        with profiler.stage('fingerprint'):
+            input_fingerprints = SceneManifest.fingerprint_inputs(analyzer.input_paths)
+        export_paths = _get_export_paths(export_dir, export_prefix, analyzer.scene_id, export_formats)
+        scene_stats = analyzer.analyze(pairwise_distances)
+
+        # the manifest entry is only written once the statistics are in place
+        with profiler.stage('export'):
+            if 'json' in export_paths:
+                export_json_file_atomically([scene_stats], export_paths['json'])
+            if 'npz' in export_paths:
+                export_scene_stats_as_npz_file(scene_stats, export_paths['npz'])
+            SceneManifest(os.path.join(export_dir, MANIFEST_DIR_NAME)).record(
+                analyzer.scene_id, input_fingerprints, list(export_paths.values()), analyzer.version)
     except Exception as e:
         print(f'Error processing scene {scene_dir}: {e}')
+    return _task_record('scene', scene_dir, start_time, profiler)
+
+
+def process_scene_block(
+        scene_dir: str, block_idx: int, n_blocks: int, analyzer_kwargs: Optional[dict] = None,
+        shared_instances: Optional[SharedSceneInstances] = None, profile: bool = False
+) -> tuple[dict[str, any], Optional[dict[str, float]]]:
+    """Calculate one block of the pairwise distances of a scene split across workers"""
+    start_time = time.time()
+    profiler = StageProfiler(enabled=profile)
+    try:
+        analyzer = ScanNetSceneAnalyzer(scene_dir, **(analyzer_kwargs or {}))
+        analyzer.profiler = profiler
+        if shared_instances is not None:
+            analyzer.attach_shared_instances(shared_instances)
+        pairwise_distances = analyzer.calc_pairwise_distance_block(block_idx, n_blocks)
+    except Exception as e:
+        print(f'Error processing block {block_idx + 1}/{n_blocks} of scene {scene_dir}: {e}')
+        pairwise_distances = None
+    return _task_record(f'block {block_idx + 1}/{n_blocks}', scene_dir, start_time, profiler), pairwise_distances
 
 
 @click.command()
@@ -189,10 +521,44 @@ def process_scene(scene_dir: str, export_dir: str, export_prefix: str) -> None:
                    '(e.g., scene_001 -> scene_stats-scene_001.json)')
 @click.option('--n_jobs', default=-1, type=click.IntRange(-1, None),
               help='Number of parallel jobs to process the scenes')
+@click.option('--assign_mode', default='lookup', type=click.Choice(ScanNetSceneAnalyzer.ASSIGN_MODES),
+              help='How vertices are assigned to instances: "lookup" labels all vertices in a single pass, '
+                   '"mask" builds one boolean mask per object. Default is "lookup"')
+@click.option('--distance_mode', default='vertex', type=click.Choice(SurfaceDistanceEngine.DISTANCE_MODES),
+              help='How the surface distance between two objects is measured: "vertex" takes the minimum distance '
+                   'between their convex hull vertices, "hull" the exact distance between their convex hulls '
+                   '(GJK algorithm). Default is "vertex"')
+@click.option('--graph_radius', default=None, type=click.FloatRange(0, None),
+              help='Only calculate the distances of object pairs within this radius (in meters), '
+                   'plus those given by --graph_k. Default is all pairs')
+@click.option('--graph_k', default=None, type=click.IntRange(1, None),
+              help='Only calculate the distances between each object and its k nearest neighbours, '
+                   'plus those given by --graph_radius. Default is all pairs')
+@click.option('--export_format', 'export_formats', default=['json'], multiple=True,
+              type=click.Choice(EXPORT_FORMATS),
+              help='Format of the exported scene statistics, can be given multiple times: "json" for the '
+                   'scene statistics JSON, "npz" for columnar NumPy arrays with a dense distance matrix that '
+                   'can be memory-mapped. Default is "json"')
+@click.option('--split_vertices', default=250000, type=click.IntRange(0, None),
+              help='Split the pairwise distances of scenes with more vertices than this across all workers. '
+                   'Set to 0 to never split scenes. Default is 250000')
+@click.option('--profile_report', default=None, type=click.Path(dir_okay=False, writable=True),
+              help='Record the wall time, vertex / instance / pair counts and peak RSS of each analysis stage of '
+                   'each scene, export them to this CSV or JSON file and print the slowest scenes and stages. '
+                   'Default is no profiling')
+@click.option('-i', '--incremental', is_flag=True, default=False,
+              help='Keep the existing files in the export directory and only analyze scenes that are new, '
+                   'or whose input files or analyzer version changed since they were last exported')
 @click.option('-s', '--skip_confirm', is_flag=True, default=False,
               help='Skip the confirmation prompt before processing the scenes')
-def cli(scenes, export_dir, export_prefix, n_jobs, skip_confirm):
-    """CLI for process ScanNet scene folders and export the scene statistics as JSON files"""
+def cli(
+        scenes, export_dir, export_prefix, n_jobs,
+        assign_mode, distance_mode, graph_radius, graph_k, export_formats, split_vertices, profile_report,
+        incremental, skip_confirm
+):
+    """CLI for process ScanNet scene folders and export the scene statistics as JSON (and/or NPZ) files"""
+    if profile_report is not None and Path(profile_report).suffix.lower() not in PROFILE_REPORT_FORMATS:
+        raise click.BadParameter(f'Must end with one of {PROFILE_REPORT_FORMATS}', param_hint='--profile_report')
     subfolders = [f.path for f in os.scandir(scenes) if f.is_dir()]
     scene_folders = subfolders if len(subfolders) > 0 else [scenes]
 
@@ -204,19 +570,93 @@ def cli(scenes, export_dir, export_prefix, n_jobs, skip_confirm):
     if not skip_confirm and not click.confirm('Proceed?', default=True):
         return
     os.makedirs(export_dir, exist_ok=True)
+    if incremental:
+        # only reanalyze scenes that are missing or stale
+        n_found = len(scene_folders)
+        scene_folders = [
+            scene_dir for scene_dir in scene_folders
+            if not is_scene_up_to_date(scene_dir, export_dir, export_prefix, export_formats, {
+                'distance_mode': distance_mode, 'graph_radius': graph_radius, 'graph_k': graph_k})
+        ]
+        print(f'Skipping {n_found - len(scene_folders)} up-to-date scene(s).')
     # if export path is not empty, ask whether remove the existing files
-    if os.listdir(export_dir):
+    elif os.listdir(export_dir):
         if not click.confirm(f'Files already exist in {export_dir}. Remove existing files?', default=True):
             return
         for file in os.listdir(export_dir):
-            os.remove(os.path.join(export_dir, file))
+            file_path = os.path.join(export_dir, file)
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+            else:
+                os.remove(file_path)
+
+    # schedule the largest scenes first, and split the largest of them into blocks of pairwise distances
+    scene_sizes = {scene_dir: estimate_scene_size(scene_dir) for scene_dir in scene_folders}
+    scene_folders = sorted(scene_folders, key=lambda scene_dir: scene_sizes[scene_dir], reverse=True)
+    n_workers = effective_n_jobs(n_jobs)
+    split_scene_folders = [
+        scene_dir for scene_dir in scene_folders
+        if n_workers > 1 and split_vertices and scene_sizes[scene_dir] > split_vertices and
+           graph_radius is None and graph_k is None
+    ]
+    analyzer_kwargs = {
+        'assign_mode': assign_mode, 'distance_mode': distance_mode,
+        'graph_radius': graph_radius, 'graph_k': graph_k,
+    }
 
     print(f'{f" Start processing {len(scene_folders)} ScanNet scene folders ":=^80}')
-    ParallelTqdm(n_jobs=n_jobs)(
-        [delayed(process_scene)(scene_dir, export_dir, export_prefix)
-         for scene_dir in scene_folders]
-    )
+    if split_scene_folders:
+        print(f'Splitting {len(split_scene_folders)} scene(s) with more than {split_vertices} vertices '
+              f'into {n_workers} blocks of pairwise distances.')
+    start_time = time.time()
+    # load each split scene and build its convex hulls once into shared buffers, which all of its block tasks attach to
+    shared_instances = {}
+    for scene_dir in split_scene_folders:
+        try:
+            shared_instances[scene_dir] = ScanNetSceneAnalyzer(scene_dir, **analyzer_kwargs).share_instances()
+        except Exception as e:
+            print(f'Error sharing the instances of scene {scene_dir}, loading them per block instead: {e}')
+    try:
+        results = ParallelTqdm(n_jobs=n_jobs, batch_size=1)(
+            [delayed(process_scene_block)(
+                scene_dir, block_idx, n_workers, analyzer_kwargs, shared_instances.get(scene_dir),
+                profile_report is not None
+            ) for scene_dir in split_scene_folders for block_idx in range(n_workers)] +
+            [delayed(process_scene)(
+                scene_dir, export_dir, export_prefix, export_formats, analyzer_kwargs,
+                profile=profile_report is not None
+            ) for scene_dir in scene_folders if scene_dir not in split_scene_folders]
+        )
+        task_records = [result[0] if isinstance(result, tuple) else result for result in results]
+
+        if split_scene_folders:
+            # merge the blocks of each split scene, skipping scenes with failed blocks
+            block_results = [result for result in results if isinstance(result, tuple)]
+            merged_distances = {}
+            for split_idx, scene_dir in enumerate(split_scene_folders):
+                blocks = [
+                    distances for _, distances in block_results[split_idx * n_workers:(split_idx + 1) * n_workers]
+                ]
+                if all(distances is not None for distances in blocks):
+                    merged_distances[scene_dir] = {
+                        key: dist for distances in blocks for key, dist in distances.items()
+                    }
+            task_records += ParallelTqdm(n_jobs=n_jobs, batch_size=1)(
+                [delayed(process_scene)(
+                    scene_dir, export_dir, export_prefix, export_formats, analyzer_kwargs,
+                    pairwise_distances, shared_instances.get(scene_dir), profile_report is not None
+                ) for scene_dir, pairwise_distances in merged_distances.items()]
+            )
+    finally:
+        for instances in shared_instances.values():
+            instances.unlink()
     print(f'{f" Finished processing {len(scene_folders)} ScanNet scene folders ":=^80}')
+    print(summarize_worker_utilisation(task_records, time.time() - start_time))
+    if profile_report is not None:
+        stage_rows = [row for record in task_records for row in record['stages']]
+        export_profile_report(stage_rows, profile_report)
+        print(summarize_profile(stage_rows))
+        print(f'Profile report exported to {os.path.abspath(profile_report)}.')
 
 
 if __name__ == '__main__':
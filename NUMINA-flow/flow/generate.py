@@ -0,0 +1,246 @@
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+from joblib import delayed
+
+from .rule.base.artefacts import SceneArtefacts
+from .rule.base.fingerprint import QuestionFingerprintStore, fingerprint_question
+from .rule.distance_FV import DistanceCompareFVGenerator
+from .rule.distance_NI import DistanceNIGenerator
+from .rule.quantity_FV import QuantityCompareFVGenerator
+from .rule.quantity_NI import QuantityNIGenerator
+from .rule.volume_FV import VolumeCompareFVGenerator
+from .rule.volume_NI import VolumeNIGenerator
+from .utils.io import export_json_file_atomically, load_json_file_as_dict, load_jsonl_shards, remove_jsonl_shards
+from .utils.parallel import ParallelTqdm, summarize_worker_utilisation
+
+# generators by name, with the file their questions are merged into
+GENERATORS = {
+    'volume-NI': (VolumeNIGenerator, 'NUM-volume-NI.json'),
+    'volume_compare-FV': (VolumeCompareFVGenerator, 'NUM-volume_compare-FV.json'),
+    'count-NI': (QuantityNIGenerator, 'NUM-count-NI.json'),
+    'count_compare-FV': (QuantityCompareFVGenerator, 'NUM-count_compare-FV.json'),
+    'distance-NI': (DistanceNIGenerator, 'NUM-distance-NI.json'),
+    'distance_compare-FV': (DistanceCompareFVGenerator, 'NUM-distance_compare-FV.json'),
+}
+SCENE_STAT_FORMATS = ['json', 'npz']
+# directory (in the output directory) of the questions of each (scene, generator) task
+TASK_DIR_NAME = 'shards'
+# file (in the task directory) recording the scenes and settings of the run the tasks belong to
+RUN_MANIFEST_NAME = 'run.json'
+# suffix of the marker written next to the task file once a task is complete, also if it has no questions
+TASK_DONE_SUFFIX = '.done'
+
+
+def derive_seed(run_seed: int, scene_id: str, generator_name: str) -> int:
+    """Seed of a (scene, generator) task, independent of the process and the shard running it"""
+    digest = hashlib.blake2b(f'{run_seed}:{scene_id}:{generator_name}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def get_shard_scene_files(scene_files: List[str], shard_index: int, shard_count: int) -> List[str]:
+    """Scene statistics files of a shard, dealt round-robin in file name order"""
+    return sorted(scene_files, key=lambda f: Path(f).name)[shard_index::shard_count]
+
+
+def get_run_manifest(
+        scene_files: List[str], generator_names: List[str], generate_kwargs: dict, run_seed: int
+) -> dict:
+    """Scenes (of all shards) and settings of a run, which all shards of the run must agree on"""
+    return {
+        'scene_stems': sorted(Path(scene_file).stem for scene_file in scene_files),
+        'generators': sorted(generator_names),
+        'seed': run_seed,
+        **generate_kwargs,
+    }
+
+
+def _get_run_manifest_file(output_dir: str) -> str:
+    return os.path.join(output_dir, TASK_DIR_NAME, RUN_MANIFEST_NAME)
+
+
+def load_run_manifest(output_dir: str) -> Optional[dict]:
+    """Manifest of the run whose tasks are in the output directory, None if there is none"""
+    manifest_file = _get_run_manifest_file(output_dir)
+    return load_json_file_as_dict(manifest_file, is_strict=True) if os.path.isfile(manifest_file) else None
+
+
+def start_run(output_dir: str, run_manifest: dict, is_sharded: bool) -> None:
+    """Record the manifest of a run before generating its tasks
+
+    A run on its own replaces the tasks of any earlier run. A shard instead keeps the tasks of the other
+    shards of its run, so it is refused if the output directory holds the tasks of a different run.
+    """
+    existing_manifest = load_run_manifest(output_dir)
+    if not is_sharded:
+        shutil.rmtree(os.path.join(output_dir, TASK_DIR_NAME), ignore_errors=True)
+    elif existing_manifest is not None and existing_manifest != run_manifest:
+        raise click.ClickException(
+            f'{os.path.abspath(output_dir)} holds the tasks of a run with other scenes or settings. '
+            f'Use another output directory, or remove {os.path.join(output_dir, TASK_DIR_NAME)} first.')
+    os.makedirs(os.path.join(output_dir, TASK_DIR_NAME), exist_ok=True)
+    export_json_file_atomically(run_manifest, _get_run_manifest_file(output_dir))
+
+
+def _get_task_json_file(output_dir: str, generator_name: str, scene_file: str) -> str:
+    return os.path.join(output_dir, TASK_DIR_NAME, generator_name, f'{Path(scene_file).stem}.json')
+
+
+def is_task_done(task_json_file: str) -> bool:
+    """Whether a task ran to completion, so that its questions are all in sealed shards"""
+    return os.path.isfile(task_json_file + TASK_DONE_SUFFIX)
+
+
+def generate_scene(
+        scene_file: str, output_dir: str, generator_names: List[str],
+        run_seed: int = 0, generate_kwargs: Optional[dict] = None
+) -> dict[str, any]:
+    """Generate the questions of all generators for a scene, each into the JSONL shards of its own task file
+
+    The scene is loaded once and its artefacts (label histogram, eligible instances, ...) are derived once
+    for all generators. Nothing is shared between tasks, so no lock is taken, and rerunning a task
+    replaces its questions. Each task is marked done once its generator returns, even without questions.
+    """
+    start_time = time.time()
+    try:
+        scene_artefacts = SceneArtefacts.from_file(scene_file)
+    except Exception as e:
+        click.echo(f'[ERROR] {scene_file}: Failed to load the scene as "{e}".')
+        generator_names = []
+    for generator_name in generator_names:
+        task_json_file = _get_task_json_file(output_dir, generator_name, scene_file)
+        if os.path.isfile(task_json_file + TASK_DONE_SUFFIX):
+            os.remove(task_json_file + TASK_DONE_SUFFIX)
+        remove_jsonl_shards(task_json_file)
+        try:
+            generator = GENERATORS[generator_name][0](
+                scene_stat_json_file=scene_file, output_json_file=task_json_file, scene_artefacts=scene_artefacts,
+                defer_output_compaction=True
+            )
+            generator.seed(derive_seed(run_seed, generator.scene_id, generator_name))
+            generator.generate(**(generate_kwargs or {}))
+            os.makedirs(os.path.dirname(task_json_file), exist_ok=True)
+            open(task_json_file + TASK_DONE_SUFFIX, 'w').close()
+        except Exception as e:
+            click.echo(f'[ERROR] {scene_file} - {generator_name}: Failed to generate questions as "{e}".')
+    return {'task': 'scene', 'scene_id': Path(scene_file).stem,
+            'worker': os.getpid(), 'start_time': start_time, 'end_time': time.time()}
+
+
+def merge_shards(output_dir: str, generator_names: List[str], scene_stems: List[str]) -> Dict[str, int]:
+    """Merge the questions of the tasks of each generator on the scenes of a run into its output file, in scene
+    file name order
+
+    The merged files only depend on the tasks, not on how they were sharded, and tasks left over from other
+    runs are ignored. Only the sealed shards of completed tasks are merged, so that unfinished or killed tasks
+    contribute no partial questions. Each task only dedupes its own questions, so duplicates across tasks
+    (e.g., two statistics files of the same scene) are dropped here. Returns the number of questions merged
+    per generator.
+    """
+    n_questions = {}
+    for generator_name in generator_names:
+        task_json_files = [
+            os.path.join(output_dir, TASK_DIR_NAME, generator_name, f'{scene_stem}.json')
+            for scene_stem in sorted(scene_stems)
+        ]
+        done_task_json_files = [task_json_file for task_json_file in task_json_files if is_task_done(task_json_file)]
+        if len(done_task_json_files) < len(task_json_files):
+            click.echo(f'[WARN] {generator_name}: {len(task_json_files) - len(done_task_json_files)} scene(s) '
+                       f'of the run have not been generated.')
+        fingerprint_store = QuestionFingerprintStore()
+        question_dicts, n_duplicates = [], 0
+        for task_json_file in done_task_json_files:
+            for q_dict in load_jsonl_shards(task_json_file, include_unsealed=False):
+                if fingerprint_store.add(fingerprint_question(q_dict['scene_id'], q_dict['question_type'], q_dict)):
+                    question_dicts.append(q_dict)
+                else:
+                    n_duplicates += 1
+        if n_duplicates > 0:
+            click.echo(f'[WARN] {generator_name}: {n_duplicates} duplicate question(s) across tasks dropped.')
+        export_json_file_atomically(question_dicts, os.path.join(output_dir, GENERATORS[generator_name][1]))
+        n_questions[generator_name] = len(question_dicts)
+    return n_questions
+
+
+@click.command()
+@click.option('--scene_stats',
+              type=click.Path(exists=True, file_okay=True, dir_okay=True, readable=True),
+              prompt='Enter the scene statistics directory path',
+              help='The directory containing the scene statistics files exported by the scene analyzer')
+@click.option('--scene_format', default='json', type=click.Choice(SCENE_STAT_FORMATS),
+              help='Format of the scene statistics files to read. Default is "json"')
+@click.option('--output_dir', default='./output/questions/',
+              type=click.Path(file_okay=False, writable=True),
+              help='The directory to export the generated questions')
+@click.option('--generator', 'generator_names', default=list(GENERATORS), multiple=True,
+              type=click.Choice(list(GENERATORS)),
+              help='Generator to run, can be given multiple times. Default is all generators')
+@click.option('--n_questions', default=6, type=click.IntRange(1, None),
+              help='Number of questions per generator and scene. Default is 6')
+@click.option('--max_attempts', default=5, type=click.IntRange(1, None),
+              help='Number of attempts to generate each question. Default is 5')
+@click.option('--seed', default=0, type=int,
+              help='Run seed, from which the seed of each scene and generator is derived. Default is 0')
+@click.option('--n_jobs', default=-1, type=click.IntRange(-1, None),
+              help='Number of parallel jobs to process the scenes')
+@click.option('--shard_index', default=0, type=click.IntRange(0, None),
+              help='Index of the shard of scenes to process (e.g., on this machine). Default is 0')
+@click.option('--shard_count', default=1, type=click.IntRange(1, None),
+              help='Number of shards the scenes are split into. The questions are merged once all shards are '
+                   'done, automatically if there is a single shard, with --merge_only otherwise. Default is 1')
+@click.option('-m', '--merge_only', is_flag=True, default=False,
+              help='Only merge the questions of all shards of the run in the output directory into the output files')
+@click.option('-s', '--skip_confirm', is_flag=True, default=False,
+              help='Skip the confirmation prompt before processing the scenes')
+def cli(
+        scene_stats, scene_format, output_dir, generator_names, n_questions, max_attempts, seed, n_jobs,
+        shard_index, shard_count, merge_only, skip_confirm
+):
+    """CLI for generating rule-based questions from the scene statistics, in shards with reproducible seeds"""
+    if shard_index >= shard_count:
+        raise click.BadParameter(f'Must be less than --shard_count ({shard_count})', param_hint='--shard_index')
+    generator_names = list(dict.fromkeys(generator_names))
+    if not merge_only:
+        scene_files = (
+            [f.path for f in os.scandir(scene_stats) if f.is_file() and f.name.endswith(f'.{scene_format}')]
+            if os.path.isdir(scene_stats) else [scene_stats]
+        )
+        shard_scene_files = get_shard_scene_files(scene_files, shard_index, shard_count)
+        print(f'Found {len(scene_files)} scene(s), {len(shard_scene_files)} in shard {shard_index + 1}/{shard_count} '
+              f'to be processed with {n_jobs if n_jobs != -1 else os.cpu_count()} process(es):')
+        print('\n'.join(shard_scene_files if len(shard_scene_files) <= 6 else
+                        shard_scene_files[:3] + ['...'] + shard_scene_files[-3:]))
+        print(f'Questions of {len(generator_names)} generator(s) will be exported to {os.path.abspath(output_dir)}.')
+        if not skip_confirm and not click.confirm('Proceed?', default=True):
+            return
+        generate_kwargs = {'n_questions': n_questions, 'max_attempts': max_attempts}
+        start_run(output_dir, get_run_manifest(scene_files, generator_names, generate_kwargs, seed), shard_count > 1)
+
+        print(f'{f" Start generating questions for {len(shard_scene_files)} scenes ":=^80}')
+        start_time = time.time()
+        task_records = ParallelTqdm(n_jobs=n_jobs)(
+            delayed(generate_scene)(
+                scene_file, output_dir, generator_names, seed, generate_kwargs
+            ) for scene_file in shard_scene_files
+        )
+        print(f'{f" Finished generating questions for {len(shard_scene_files)} scenes ":=^80}')
+        print(summarize_worker_utilisation(task_records, time.time() - start_time))
+        if shard_count > 1:
+            print(f'Run with --merge_only once all {shard_count} shards are done to merge their questions.')
+            return
+
+    run_manifest = load_run_manifest(output_dir)
+    if run_manifest is None:
+        raise click.ClickException(f'No run to merge in {os.path.abspath(output_dir)}')
+    generator_names = [name for name in generator_names if name in run_manifest['generators']]
+    for generator_name, n_merged in merge_shards(output_dir, generator_names, run_manifest['scene_stems']).items():
+        print(f'Merged {n_merged} questions into {os.path.join(output_dir, GENERATORS[generator_name][1])}.')
+
+
+if __name__ == '__main__':
+    cli()
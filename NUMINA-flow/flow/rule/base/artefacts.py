@@ -0,0 +1,64 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from ...utils.scene import SceneData, SceneInstance, load_scene_data
+
+
+class SceneArtefacts:
+    """Per-scene artefacts shared by all generators of a scene, so that each is derived only once
+
+    Holds the label histogram and the object IDs of each label, and caches the eligible instances of
+    each filter configuration (excluded labels, instance filter, repeated labels allowed). The distance
+    matrix is shared through the scene data itself.
+    """
+
+    def __init__(self, scene_data: SceneData) -> None:
+        self.scene_data = scene_data
+        self.label_object_ids: Dict[str, List[int]] = {}
+        for instance in scene_data.instances:
+            self.label_object_ids.setdefault(instance.label, []).append(instance.object_id)
+        self.label_counts: Dict[str, int] = {label: len(ids) for label, ids in self.label_object_ids.items()}
+        self._eligible_masks: Dict[Tuple, np.ndarray] = {}
+        self._eligible_instances: Dict[Tuple, List[SceneInstance]] = {}
+
+    @classmethod
+    def from_file(cls, scene_stat_json_file: str) -> 'SceneArtefacts':
+        return cls(load_scene_data(scene_stat_json_file))
+
+    def get_label_object_ids(self, label: str) -> List[int]:
+        """Object IDs of the instances of a label, as a new list"""
+        return list(self.label_object_ids.get(label, []))
+
+    def get_eligible_mask(
+            self,
+            excluded_labels: Iterable[str],
+            instance_filter: Callable[[SceneInstance], bool],
+            allow_repeated: bool
+    ) -> np.ndarray:
+        """Boolean mask of the scene instances that are not excluded, pass the filter and, unless repeated
+        labels are allowed, are the only instance of their label"""
+        key = (frozenset(excluded_labels), instance_filter, allow_repeated)
+        if key not in self._eligible_masks:
+            self._eligible_masks[key] = np.array([
+                (instance.label not in key[0]) and
+                instance_filter(instance) and
+                (allow_repeated or self.label_counts[instance.label] == 1)
+                for instance in self.scene_data.instances
+            ], dtype=bool)
+        return self._eligible_masks[key]
+
+    def get_eligible_instances(
+            self,
+            excluded_labels: Iterable[str],
+            instance_filter: Callable[[SceneInstance], bool],
+            allow_repeated: bool
+    ) -> List[SceneInstance]:
+        """Scene instances selected by the eligible mask, in scene order, as a new list"""
+        key = (frozenset(excluded_labels), instance_filter, allow_repeated)
+        if key not in self._eligible_instances:
+            mask = self.get_eligible_mask(excluded_labels, instance_filter, allow_repeated)
+            self._eligible_instances[key] = [
+                instance for instance, is_eligible in zip(self.scene_data.instances, mask) if is_eligible
+            ]
+        return list(self._eligible_instances[key])
@@ -1,13 +1,16 @@
 import random
 import traceback
 from abc import ABC, abstractmethod
-from itertools import product
 from typing import Optional, List, Dict, Any, Union
 
 import click
+import numpy as np
 
-from ...utils.io import export_dict_as_json_file
-from ...utils.scene import SceneData, SceneInstance
+from .artefacts import SceneArtefacts
+from .candidates import PairCandidateSpace, PairOfPairsCandidateSpace
+from .fingerprint import QuestionFingerprintStore, fingerprint_question
+from ...utils.io import JSONLShardWriter, compact_jsonl_shards
+from ...utils.scene import SceneInstance
 
 
 class RuleBasedQGen(ABC):
@@ -20,9 +23,14 @@ class RuleBasedQGen(ABC):
             output_json_file: str,
             question_type: str = 'DEFAULT_RULE',
             excluded_labels: Optional[List[str]] = None,
+            scene_artefacts: Optional[SceneArtefacts] = None,
+            defer_output_compaction: bool = False,
     ) -> None:
         """Initialize rule-based question generator"""
-        self.scene_data = SceneData(scene_stat_json_file)
+        # the scene data is shared with the other generators of the same scene in this process, the artefacts
+        # derived from it with those constructed with the same artefacts
+        self.scene_artefacts = scene_artefacts or SceneArtefacts.from_file(scene_stat_json_file)
+        self.scene_data = self.scene_artefacts.scene_data
         self.scene_id = self.scene_data.scene_id
 
         # configure valid instances
@@ -31,6 +39,23 @@ class RuleBasedQGen(ABC):
         # configure metadata and export JSON file
         self.question_type = question_type
         self.output_json_file = output_json_file
+        # leave the exported questions in JSONL shards, to be compacted by finalize_output once all generators
+        # writing to the same output file are done (e.g., by parallel callers)
+        self.defer_output_compaction = defer_output_compaction
+        # draw from the process-global random number generator unless seeded
+        self.rng = random
+
+    def seed(self, seed: Optional[int]) -> None:
+        """Draw from a random number generator of its own, seeded with the seed"""
+        self.rng = random.Random(seed)
+
+    @staticmethod
+    def finalize_output(output_json_file: str) -> int:
+        """Compact the questions exported by all generators (and processes) into the output JSON file
+
+        Run once all generators writing to the file are done. Returns the number of questions compacted.
+        """
+        return compact_jsonl_shards(output_json_file)
 
     # candidate pool preparation related methods
     @staticmethod
@@ -40,13 +65,8 @@ class RuleBasedQGen(ABC):
 
     def _get_available_instances(self, allow_repeated: bool) -> List[SceneInstance]:
         """Get available instances for question generation"""
-        return [
-            instance
-            for instance in self.scene_data.instances
-            if (instance.label not in self.excluded_labels) and
-               (self._custom_instance_filter(instance)) and
-               (allow_repeated or len(self.scene_data.get_instances_by_label(instance.label)) == 1)
-        ]
+        return self.scene_artefacts.get_eligible_instances(
+            self.excluded_labels, self._custom_instance_filter, allow_repeated)
 
     @abstractmethod
     def _get_candidates(self) -> List[SceneInstance]:
@@ -73,12 +93,12 @@ class RuleBasedQGen(ABC):
                 f'Only {len(candidates)} unique candidates available for {n_questions} questions. '
                 f'Sampling only {len(candidates)} questions.'
             )
-            selected_candidates = random.sample(candidates, k=len(candidates))
+            selected_candidates = self.rng.sample(candidates, k=len(candidates))
         else:
             selected_candidates = (
-                random.sample(candidates, k=n_questions)
+                self.rng.sample(candidates, k=n_questions)
                 if not allow_duplicate_candidates else
-                random.choices(candidates, k=n_questions)
+                self.rng.choices(candidates, k=n_questions)
             )
         return selected_candidates
 
@@ -95,15 +115,16 @@ class RuleBasedQGen(ABC):
                 tuple[SceneInstance, SceneInstance],
                 tuple[tuple[SceneInstance, SceneInstance], tuple[SceneInstance, SceneInstance]]
             ],
-            q_dicts: Union[List[Dict[str, Any]], List[None]],
+            fingerprint_store: QuestionFingerprintStore,
             max_attempts: int,
             **kwargs
     ) -> Dict[str, Any]:
-        """Generate question dictionary"""
+        """Generate question dictionary, skipping those whose fingerprint is already in the store"""
         for attempt in range(max_attempts):
             try:
                 q_dict = self._form_question_dict(candidate=candidate, **kwargs)
-                if q_dict != {} and q_dict not in q_dicts:
+                if q_dict != {} and fingerprint_store.add(
+                        fingerprint_question(self.scene_id, self.question_type, q_dict)):
                     return q_dict
                 else:
                     click.echo(f'[WARN] {self.scene_id} - {self.question_type} - Attempt {attempt + 1}/{max_attempts}: '
@@ -117,30 +138,36 @@ class RuleBasedQGen(ABC):
         return {}
 
     def _export_question_dicts(self, question_dicts: List[Dict[str, Any]]) -> None:
-        """Export question dictionaries to the output JSON file"""
+        """Export question dictionaries to the output JSON file
+
+        Questions are appended to a JSONL shard, which is compacted into the JSON file right away, or by
+        finalize_output if compaction is deferred.
+        """
         if not question_dicts:
             click.echo(f'[WARN] {self.scene_id} - {self.question_type}: No questions generated. Skipping...')
             return
-        for q_dict in question_dicts:
-            # skip empty question dictionaries
-            if not q_dict:
-                continue
-            export_dict_as_json_file(
-                {
-                    'scene_id': self.scene_data.scene_id,
-                    'question_type': self.question_type,
-                    **{
-                        k: v.replace(
-                            '\n', ' ').replace(
-                            '\\', '').replace(
-                            '\t', ' ').replace(
-                            '  ', ' ').strip()
-                        if isinstance(v, str) else v
-                        for k, v in q_dict.items()
+        with JSONLShardWriter(self.output_json_file) as writer:
+            for q_dict in question_dicts:
+                # skip empty question dictionaries
+                if not q_dict:
+                    continue
+                writer.append(
+                    {
+                        'scene_id': self.scene_data.scene_id,
+                        'question_type': self.question_type,
+                        **{
+                            k: v.replace(
+                                '\n', ' ').replace(
+                                '\\', '').replace(
+                                '\t', ' ').replace(
+                                '  ', ' ').strip()
+                            if isinstance(v, str) else v
+                            for k, v in q_dict.items()
+                        }
                     }
-                },
-                self.output_json_file
-            )
+                )
+        if not self.defer_output_compaction:
+            compact_jsonl_shards(self.output_json_file)
 
 
 class SingleObjectCandidateMixin(RuleBasedQGen, ABC):
@@ -153,9 +180,14 @@ class SingleObjectCandidateMixin(RuleBasedQGen, ABC):
             question_type: str = 'DEFAULT_RULE',
             excluded_labels: Optional[List[str]] = None,
             allow_repeated_objects: bool = True,
+            scene_artefacts: Optional[SceneArtefacts] = None,
+            defer_output_compaction: bool = False,
     ) -> None:
         """Initialize single object question generator"""
-        super().__init__(scene_stat_json_file, output_json_file, question_type, excluded_labels)
+        super().__init__(
+            scene_stat_json_file, output_json_file, question_type, excluded_labels, scene_artefacts,
+            defer_output_compaction
+        )
         self.allow_repeated_objects = allow_repeated_objects
 
     def _get_candidates(self) -> List[SceneInstance]:
@@ -174,22 +206,26 @@ class DualObjectsCandidateMixin(RuleBasedQGen, ABC):
             excluded_labels: Optional[List[str]] = None,
             allow_repeated_inst1s: bool = True,
             allow_repeated_inst2s: bool = True,
+            scene_artefacts: Optional[SceneArtefacts] = None,
+            defer_output_compaction: bool = False,
     ) -> None:
         """Initialize dual objects question generator"""
-        super().__init__(scene_stat_json_file, output_json_file, question_type, excluded_labels)
+        super().__init__(
+            scene_stat_json_file, output_json_file, question_type, excluded_labels, scene_artefacts,
+            defer_output_compaction
+        )
         self.allow_repeated_inst1s = allow_repeated_inst1s
         self.allow_repeated_inst2s = allow_repeated_inst2s
 
-    def _get_candidates(self) -> List[tuple[SceneInstance, SceneInstance]]:
-        """Get candidate instance pairs for dual objects question generation"""
+    def _get_candidates(self) -> PairCandidateSpace:
+        """Get candidate instance pairs for dual objects question generation
+
+        The pairs are a lazy sequence that is sampled by index instead of materialised.
+        """
         candidate_inst1s = self._get_available_instances(self.allow_repeated_inst1s)
         candidate_inst2s = self._get_available_instances(self.allow_repeated_inst2s)
 
-        return [
-            (inst1, inst2)
-            for inst1, inst2 in product(candidate_inst1s, candidate_inst2s)
-            if inst1 != inst2
-        ]
+        return PairCandidateSpace(candidate_inst1s, candidate_inst2s)
 
 
 class DualObjectPairsCandidateMixin(RuleBasedQGen, ABC):
@@ -203,44 +239,104 @@ class DualObjectPairsCandidateMixin(RuleBasedQGen, ABC):
             allow_repeated_inst1bs: bool = True,
             allow_repeated_inst2as: bool = True,
             allow_repeated_inst2bs: bool = True,
+            scene_artefacts: Optional[SceneArtefacts] = None,
+            defer_output_compaction: bool = False,
     ) -> None:
         """Initialize dual object pairs question generator"""
-        super().__init__(scene_stat_json_file, output_json_file, question_type, excluded_labels)
+        super().__init__(
+            scene_stat_json_file, output_json_file, question_type, excluded_labels, scene_artefacts,
+            defer_output_compaction
+        )
 
         self.allow_repeated_inst1as = allow_repeated_inst1as
         self.allow_repeated_inst1bs = allow_repeated_inst1bs
         self.allow_repeated_inst2as = allow_repeated_inst2as
         self.allow_repeated_inst2bs = allow_repeated_inst2bs
 
-    def _get_candidates(self) -> List[
-        tuple[tuple[SceneInstance, SceneInstance], tuple[SceneInstance, SceneInstance]]
-    ]:
-        """Get candidate instance pairs for dual object pairs question generation"""
+    def _get_candidates(self) -> PairOfPairsCandidateSpace:
+        """Get candidate instance pairs for dual object pairs question generation
+
+        The O(N^4) candidates are a lazy sequence that is sampled by index instead of materialised.
+        """
         candidate_inst1as = self._get_available_instances(self.allow_repeated_inst1as)
         candidate_inst1bs = self._get_available_instances(self.allow_repeated_inst1bs)
         candidate_inst2as = self._get_available_instances(self.allow_repeated_inst2as)
         candidate_inst2bs = self._get_available_instances(self.allow_repeated_inst2bs)
 
-        return [
-            ((obj1a, obj1b), (obj2a, obj2b))
-            for (obj1a, obj1b), (obj2a, obj2b) in product(
-                product(candidate_inst1as, candidate_inst1bs),
-                product(candidate_inst2as, candidate_inst2bs)
-            )
-            # distinct elements in each pair
-            if obj1a != obj1b and obj2a != obj2b
-               # distinct pairs
-               and {obj1a, obj1b} != {obj2a, obj2b}
-        ]
+        # distinct elements in each pair, and distinct pairs
+        return PairOfPairsCandidateSpace(candidate_inst1as, candidate_inst1bs, candidate_inst2as, candidate_inst2bs)
 
 
 class FactValidationMixin(RuleBasedQGen, ABC):
+    # relations of the generator ({relation: {'func': predicate, ...}}), required by the stratified mode
+    RELATION_DICT: Dict[str, Dict[str, Any]] = {}
+    # maximum number of candidates whose truth table is evaluated in stratified mode
+    STRATIFIED_POOL_SIZE = 100000
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.question_type = 'FV'
 
-    @staticmethod
+    def _get_relation_operands(self, candidates: List) -> tuple[np.ndarray, np.ndarray]:
+        """Override to return the two values compared by the relations for every candidate (NaN if unavailable)"""
+        raise NotImplementedError
+
+    def _prepare_stratified_pool(
+            self,
+            preset_booleans: List[bool],
+            allow_duplicate_candidates: bool = False,
+    ) -> List[tuple[Any, str, bool]]:
+        """Sample (candidate, relation, boolean) triples stratified by boolean and relation
+
+        Every relation predicate is evaluated over all candidates at once, then the relations of each
+        boolean are taken in shuffled round-robin and a candidate is drawn from the matching stratum.
+        """
+        candidates = self._get_candidates()
+        candidates = (
+            self.rng.sample(candidates, k=self.STRATIFIED_POOL_SIZE)
+            if len(candidates) > self.STRATIFIED_POOL_SIZE else
+            list(candidates)
+        )
+        relations = list(self.RELATION_DICT)
+        strata = {}
+        if candidates:
+            xs, ys = self._get_relation_operands(candidates)
+            valid = ~(np.isnan(xs) | np.isnan(ys))
+            for relation in relations:
+                truths = np.asarray(self.RELATION_DICT[relation]['func'](xs, ys), dtype=bool)
+                for boolean in (True, False):
+                    # candidate indices of the stratum, in random order
+                    strata[boolean, relation] = np.flatnonzero(valid & (truths == boolean)).tolist()
+                    self.rng.shuffle(strata[boolean, relation])
+
+        used_idxs, relation_queues, selected = set(), {True: [], False: []}, []
+        for boolean in preset_booleans:
+            candidate_idx = None
+            for _ in range(len(relations)):
+                if not relation_queues[boolean]:
+                    relation_queues[boolean] = self.rng.sample(relations, k=len(relations))
+                relation = relation_queues[boolean].pop()
+                stratum = strata.get((boolean, relation), [])
+                if allow_duplicate_candidates:
+                    candidate_idx = self.rng.choice(stratum) if stratum else None
+                else:
+                    while stratum and stratum[-1] in used_idxs:
+                        stratum.pop()
+                    candidate_idx = stratum.pop() if stratum else None
+                if candidate_idx is not None:
+                    used_idxs.add(candidate_idx)
+                    selected.append((candidates[candidate_idx], relation, boolean))
+                    break
+        if len(selected) < len(preset_booleans):
+            click.echo(
+                f'[WARN] {self.scene_id} - {self.question_type}: '
+                f'Only {len(selected)} stratified candidates available for {len(preset_booleans)} questions. '
+                f'Sampling only {len(selected)} questions.'
+            )
+        return selected
+
     def _get_preset_booleans(
+            self,
             n_questions: int,
             enforce_balanced: bool = True,
     ) -> List[bool]:
@@ -248,7 +344,7 @@ class FactValidationMixin(RuleBasedQGen, ABC):
         if enforce_balanced:
             return [i % 2 == 0 for i in range(n_questions)]
         else:
-            return [random.choice([True, False]) for _ in range(n_questions)]
+            return [self.rng.choice([True, False]) for _ in range(n_questions)]
 
     def generate(
             self,
@@ -256,16 +352,38 @@ class FactValidationMixin(RuleBasedQGen, ABC):
             max_attempts: int = 5,
             enforce_balanced: bool = True,
             allow_duplicate_objects: bool = False,
+            fingerprint_store: Optional[QuestionFingerprintStore] = None,
+            stratified: bool = False,
     ) -> None:
-        """Generate True/False questions"""
+        """Generate True/False questions
+
+        Questions are deduplicated within this call, or across all calls sharing the fingerprint store.
+        In stratified mode, (candidate, relation) pairs are sampled from the truth table of all relations
+        over all candidates, balancing the relation types of each boolean instead of picking a relation
+        per candidate.
+        """
         preset_booleans = self._get_preset_booleans(n_questions, enforce_balanced)
-        candidates = self._prepare_candidate_pool(allow_duplicate_objects, n_questions)
+        fingerprint_store = fingerprint_store if fingerprint_store is not None else QuestionFingerprintStore()
         q_dicts = []
+        if stratified:
+            for candidate, relation, preset_boolean in self._prepare_stratified_pool(
+                    preset_booleans, allow_duplicate_objects):
+                q_dicts.append(
+                    self._generate(
+                        candidate=candidate,
+                        fingerprint_store=fingerprint_store,
+                        max_attempts=max_attempts, preset_boolean=preset_boolean, relation=relation
+                    )
+                )
+            self._export_question_dicts(q_dicts)
+            return
+
+        candidates = self._prepare_candidate_pool(allow_duplicate_objects, n_questions)
         for candidate, preset_boolean in zip(candidates, preset_booleans):
             q_dicts.append(
                 self._generate(
                     candidate=candidate,
-                    q_dicts=q_dicts,
+                    fingerprint_store=fingerprint_store,
                     max_attempts=max_attempts, preset_boolean=preset_boolean
                 )
             )
@@ -282,15 +400,20 @@ class NumericalInferenceMixin(RuleBasedQGen, ABC):
             n_questions: int,
             max_attempts: int = 5,
             allow_duplicate_instances: bool = False,
+            fingerprint_store: Optional[QuestionFingerprintStore] = None,
     ) -> None:
-        """Generate Short Answer Questions"""
+        """Generate Short Answer Questions
+
+        Questions are deduplicated within this call, or across all calls sharing the fingerprint store.
+        """
         candidates = self._prepare_candidate_pool(allow_duplicate_instances, n_questions)
+        fingerprint_store = fingerprint_store if fingerprint_store is not None else QuestionFingerprintStore()
         q_dicts = []
         for candidate in candidates:
             q_dicts.append(
                 self._generate(
                     candidate=candidate,
-                    q_dicts=q_dicts,
+                    fingerprint_store=fingerprint_store,
                     max_attempts=max_attempts
                 )
             )
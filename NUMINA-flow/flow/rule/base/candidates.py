@@ -0,0 +1,120 @@
+from bisect import bisect_right
+from collections.abc import Sequence
+from itertools import accumulate
+from typing import Hashable, Iterator, List, Optional, Tuple
+
+
+class PairCandidateSpace(Sequence):
+    """Lazy sequence of the pairs (a, b) of product(firsts, seconds) with a != b
+
+    Pairs are counted, indexed and enumerated with index arithmetic in the order of the materialised
+    product, so random.sample / random.choices draw the same pairs as from the equivalent list, without
+    building it. Elements must be hashable and unique within firsts and within seconds.
+    """
+
+    def __init__(self, firsts: List[Hashable], seconds: List[Hashable]) -> None:
+        self.firsts, self.seconds = list(firsts), list(seconds)
+        self._first_pos = {item: pos for pos, item in enumerate(self.firsts)}
+        self._second_pos = {item: pos for pos, item in enumerate(self.seconds)}
+        # number of valid pairs before each first element
+        self._offsets = [0] + list(accumulate(
+            len(self.seconds) - (first in self._second_pos) for first in self.firsts
+        ))
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def __getitem__(self, idx: int | slice) -> Tuple[Hashable, Hashable] | List[Tuple[Hashable, Hashable]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('pair candidate index out of range')
+        row = bisect_right(self._offsets, idx) - 1
+        first = self.firsts[row]
+        col = idx - self._offsets[row]
+        # skip the position of the first element itself among the seconds
+        skipped_col = self._second_pos.get(first)
+        if skipped_col is not None and col >= skipped_col:
+            col += 1
+        return first, self.seconds[col]
+
+    def index_of(self, pair: Tuple[Hashable, Hashable]) -> Optional[int]:
+        """Index of a pair, or None if it is not a candidate"""
+        first, second = pair
+        if first not in self._first_pos or second not in self._second_pos or first == second:
+            return None
+        row, col = self._first_pos[first], self._second_pos[second]
+        skipped_col = self._second_pos.get(first)
+        return self._offsets[row] + col - (skipped_col is not None and col > skipped_col)
+
+    def index(self, pair: Tuple[Hashable, Hashable], *args) -> int:
+        idx = self.index_of(pair)
+        if idx is None:
+            raise ValueError(f'{pair} is not a pair candidate')
+        return idx
+
+    def __contains__(self, pair: object) -> bool:
+        return isinstance(pair, tuple) and len(pair) == 2 and self.index_of(pair) is not None
+
+    def __iter__(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        return ((first, second) for first in self.firsts for second in self.seconds if first != second)
+
+
+class PairOfPairsCandidateSpace(Sequence):
+    """Lazy sequence of ((a, b), (c, d)) with a != b, c != d and {a, b} != {c, d}
+
+    Follows the order of product(product(firsts_a, firsts_b), product(seconds_a, seconds_b)) filtered by
+    these constraints, counting and indexing the O(N^4) candidates with O(N^2) memory.
+    """
+
+    def __init__(
+            self,
+            firsts_a: List[Hashable], firsts_b: List[Hashable],
+            seconds_a: List[Hashable], seconds_b: List[Hashable]
+    ) -> None:
+        self.first_pairs = PairCandidateSpace(firsts_a, firsts_b)
+        self.second_pairs = PairCandidateSpace(seconds_a, seconds_b)
+        # number of valid candidates before each first pair, excluding the second pairs of the same objects
+        self._offsets = [0] + list(accumulate(
+            len(self.second_pairs) - len(self._excluded_second_idxs(first_pair)) for first_pair in self.first_pairs
+        ))
+
+    def _excluded_second_idxs(self, first_pair: Tuple[Hashable, Hashable]) -> List[int]:
+        """Sorted indices of the second pairs made of the same two objects as the first pair"""
+        a, b = first_pair
+        return sorted(idx for idx in (self.second_pairs.index_of((a, b)), self.second_pairs.index_of((b, a)))
+                      if idx is not None)
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def __getitem__(self, idx: int | slice):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('pair-of-pairs candidate index out of range')
+        row = bisect_right(self._offsets, idx) - 1
+        first_pair = self.first_pairs[row]
+        second_idx = idx - self._offsets[row]
+        for excluded_idx in self._excluded_second_idxs(first_pair):
+            if second_idx >= excluded_idx:
+                second_idx += 1
+        return first_pair, self.second_pairs[second_idx]
+
+    def __contains__(self, candidate: object) -> bool:
+        try:
+            first_pair, second_pair = candidate
+        except (TypeError, ValueError):
+            return False
+        return (first_pair in self.first_pairs and second_pair in self.second_pairs and
+                set(first_pair) != set(second_pair))
+
+    def __iter__(self) -> Iterator:
+        for first_pair in self.first_pairs:
+            for second_pair in self.second_pairs:
+                if set(first_pair) != set(second_pair):
+                    yield first_pair, second_pair
@@ -0,0 +1,70 @@
+import hashlib
+import json
+from numbers import Integral
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# keys of the question metadata that hold object IDs, either a single ID or a list of them
+OBJECT_ID_KEYS = ('id', 'ids', 'obj_id', 'obj_ids')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt for comparison (case and whitespace insensitive)"""
+    return ' '.join(prompt.replace('\\', '').split()).casefold()
+
+
+def get_object_ids(meta: Any) -> List[str]:
+    """Sorted object IDs referenced anywhere in the metadata of a question"""
+    object_ids = []
+    if isinstance(meta, dict):
+        for key, value in meta.items():
+            if key in OBJECT_ID_KEYS and isinstance(value, (str, Integral)):
+                object_ids.append(str(value))
+            elif key in OBJECT_ID_KEYS and isinstance(value, list) and \
+                    all(isinstance(v, (str, Integral)) for v in value):
+                object_ids.extend(str(v) for v in value)
+            else:
+                object_ids.extend(get_object_ids(value))
+    elif isinstance(meta, list):
+        for value in meta:
+            object_ids.extend(get_object_ids(value))
+    return sorted(object_ids)
+
+
+def fingerprint_question(scene_id: str, question_type: str, q_dict: Dict[str, Any]) -> str:
+    """Canonical fingerprint of a question dictionary
+
+    Two questions are duplicates if they have the same type, the same sorted object IDs in their metadata
+    and the same normalized prompt. Object IDs are only unique within a scene, so the fingerprint is also
+    scoped by the scene ID; otherwise a run-wide store would drop same-worded questions of other scenes.
+    """
+    canonical = json.dumps(
+        [scene_id, question_type, get_object_ids(q_dict.get('meta')),
+         normalize_prompt(str(q_dict.get('prompt', '')))],
+        ensure_ascii=False
+    )
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class QuestionFingerprintStore:
+    """Set of question fingerprints for constant-time duplicate detection
+
+    By default every generate() call dedupes its own questions; pass one store to the generators of a
+    whole run to also dedupe across generators. Runs of generate.py, whose tasks are separate processes,
+    dedupe across tasks when merging the outputs.
+    """
+
+    def __init__(self, fingerprints: Optional[Iterable[str]] = None) -> None:
+        self._fingerprints: Set[str] = set(fingerprints or [])
+
+    def add(self, fingerprint: str) -> bool:
+        """Add a fingerprint, returns False if it was already in the store"""
+        if fingerprint in self._fingerprints:
+            return False
+        self._fingerprints.add(fingerprint)
+        return True
+
+    def __contains__(self, fingerprint: object) -> bool:
+        return fingerprint in self._fingerprints
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
@@ -1,5 +1,6 @@
-import random
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+import numpy as np
 
 from .base.base import (
     FactValidationMixin, DualObjectPairsCandidateMixin
@@ -56,7 +57,7 @@ DISTANCE_COMPARE_FV_RELATION_DICT = {
     },
     '=': {
         # relative error <= 5%
-        'func': lambda x, y: abs(x - y) <= 0.05 * max(x, y),
+        'func': lambda x, y: np.abs(x - y) <= 0.05 * np.maximum(x, y),
         'text': 'approximately equal to',
         'templates': [
             'Is the distance between <OBJ1A> and <OBJ1B> approximately equal to the distance between <OBJ2A> and <OBJ2B>? ',
@@ -66,7 +67,7 @@ DISTANCE_COMPARE_FV_RELATION_DICT = {
         'contrapositive': '!=',
     },
     '!=': {
-        'func': lambda x, y: abs(x - y) > 0.05 * max(x, y),
+        'func': lambda x, y: np.abs(x - y) > 0.05 * np.maximum(x, y),
         'text': 'not approximately equal to',
         'templates': [
             'Is the distance between <OBJ1A> and <OBJ1B> not approximately equal to the distance between <OBJ2A> and <OBJ2B>? ',
@@ -85,6 +86,8 @@ the correct answer is <<ANSWER>>.
 
 
 class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMixin):
+    RELATION_DICT = DISTANCE_COMPARE_FV_RELATION_DICT
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.question_type = 'RULE-distance_compare-FV'
@@ -93,6 +96,16 @@ class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMi
         self.allow_repeated_inst2as = False
         self.allow_repeated_inst2bs = False
 
+    def _get_relation_operands(self, candidates: List) -> tuple[np.ndarray, np.ndarray]:
+        # distances of the two pairs of each candidate (NaN for pairs without a stored distance)
+        (inst1as, inst1bs), (inst2as, inst2bs) = (zip(*pairs) for pairs in zip(*candidates))
+        return (
+            self.scene_data.get_pairwise_distance_array(
+                [inst.object_id for inst in inst1as], [inst.object_id for inst in inst1bs]),
+            self.scene_data.get_pairwise_distance_array(
+                [inst.object_id for inst in inst2as], [inst.object_id for inst in inst2bs]),
+        )
+
     def _form_question_dict(self, **kwargs) -> Dict[str, Any]:
         (inst1a, inst1b), (inst2a, inst2b) = kwargs['candidate']
         preset_boolean = kwargs['preset_boolean']
@@ -103,27 +116,30 @@ class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMi
         dist2 = self.scene_data.get_pairwise_distance(
             inst2a.object_id, inst2b.object_id)
 
-        # find all relations that yield the intended boolean
-        valid_relations = [
-            rel for rel, info in DISTANCE_COMPARE_FV_RELATION_DICT.items()
-            if info['func'](dist1, dist2) == preset_boolean
-        ]
-        if valid_relations:
-            relation = random.choice(valid_relations)
-        else:
-            # fallback to a random relation and then swap with its contrapositive
-            relation = random.choice(
-                list(DISTANCE_COMPARE_FV_RELATION_DICT.keys()))
-            if DISTANCE_COMPARE_FV_RELATION_DICT[relation]['func'](
-                    dist1, dist2) != preset_boolean:
-                relation = DISTANCE_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
+        # the relation is given in stratified mode, otherwise it is chosen to match the intended boolean
+        relation = kwargs.get('relation')
+        if relation is None:
+            # find all relations that yield the intended boolean
+            valid_relations = [
+                rel for rel, info in DISTANCE_COMPARE_FV_RELATION_DICT.items()
+                if info['func'](dist1, dist2) == preset_boolean
+            ]
+            if valid_relations:
+                relation = self.rng.choice(valid_relations)
+            else:
+                # fallback to a random relation and then swap with its contrapositive
+                relation = self.rng.choice(
+                    list(DISTANCE_COMPARE_FV_RELATION_DICT.keys()))
+                if DISTANCE_COMPARE_FV_RELATION_DICT[relation]['func'](
+                        dist1, dist2) != preset_boolean:
+                    relation = DISTANCE_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # determine the contrapositive relation for the proposition
         contrapositive_relation = DISTANCE_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # prepare the main proposition text
         base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 DISTANCE_COMPARE_FV_RELATION_DICT[relation]['templates'])
             .replace('<OBJ1A>', inst1a.label)
             .replace('<OBJ1B>', inst1b.label)
@@ -131,11 +147,11 @@ class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMi
             .replace('<OBJ2B>', inst2b.label)
         )
         prompt_caption = 'yes' if preset_boolean else 'no'
-        base_prompt_suffix_text = random.choice(PROMPT_FV_HINT_TEMPLATES)
+        base_prompt_suffix_text = self.rng.choice(PROMPT_FV_HINT_TEMPLATES)
 
         # prepare the contrapositive proposition text
         cp_base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 DISTANCE_COMPARE_FV_RELATION_DICT[contrapositive_relation]['templates'])
             .replace('<OBJ1A>', inst1a.label)
             .replace('<OBJ1B>', inst1b.label)
@@ -162,7 +178,7 @@ class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMi
                     **{
                         inst_label: {
                             'label': inst.label,
-                            'id': [i.object_id for i in self.scene_data.get_instances_by_label(inst.label)]
+                            'id': self.scene_artefacts.get_label_object_ids(inst.label)
                         }
                         for inst_label, inst in {'inst1a': inst1a, 'inst1b': inst1b}.items()
                     },
@@ -172,7 +188,7 @@ class DistanceCompareFVGenerator(FactValidationMixin, DualObjectPairsCandidateMi
                     **{
                         inst_label: {
                             'label': inst.label,
-                            'id': [i.object_id for i in self.scene_data.get_instances_by_label(inst.label)]
+                            'id': self.scene_artefacts.get_label_object_ids(inst.label)
                         }
                         for inst_label, inst in {'inst2a': inst2a, 'inst2b': inst2b}.items()
                     },
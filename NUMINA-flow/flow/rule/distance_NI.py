@@ -1,4 +1,3 @@
-import random
 from typing import Dict, Any
 
 from .base.base import (
@@ -29,7 +28,7 @@ class DistanceNIGenerator(NumericalInferenceMixin, DualObjectsCandidateMixin):
 
         # prepare the main proposition text
         base_prompt_text = (
-            random.choice(DISTANCE_NI_TEMPLATES)
+            self.rng.choice(DISTANCE_NI_TEMPLATES)
             .replace('<OBJ1>', inst1.label)
             .replace('<OBJ2>', inst2.label)
         )
@@ -39,13 +38,13 @@ class DistanceNIGenerator(NumericalInferenceMixin, DualObjectsCandidateMixin):
                 **{
                     inst_label: {
                         'label': inst.label,
-                        'id': [i.object_id for i in self.scene_data.get_instances_by_label(inst.label)]
+                        'id': self.scene_artefacts.get_label_object_ids(inst.label)
                     }
                     for inst_label, inst in {'inst1': inst1, 'inst2': inst2}.items()
                 },
                 'pairwise_distance': dist,
             },
-            'prompt': base_prompt_text + random.choice(PROMPT_NI_HINT_TEMPLATES),
+            'prompt': base_prompt_text + self.rng.choice(PROMPT_NI_HINT_TEMPLATES),
             'caption': f'{round(dist, 3):.2f}',
             'ref_captions': [f'{round(dist, 3):.2f}'],
         }
@@ -1,6 +1,7 @@
-import random
 from typing import Dict, Any, List, Tuple
 
+import numpy as np
+
 from .base.base import (
     DualObjectsCandidateMixin, FactValidationMixin
 )
@@ -82,6 +83,8 @@ Therefore, the answer is <<ANSWER>>"""
 
 
 class QuantityCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin):
+    RELATION_DICT = QUANTITY_COMPARE_FV_RELATION_DICT
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.question_type = 'RULE-count_compare-FV'
@@ -96,46 +99,55 @@ class QuantityCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin)
             if inst1.label != inst2.label
         ]
 
+    def _get_relation_operands(self, candidates: List) -> tuple[np.ndarray, np.ndarray]:
+        # instance counts of the two labels of each candidate
+        counts = self.scene_artefacts.label_counts
+        return (
+            np.array([counts[label1] for label1, _ in candidates], dtype=np.float64),
+            np.array([counts[label2] for _, label2 in candidates], dtype=np.float64),
+        )
+
     def _form_question_dict(self, **kwargs) -> Dict[str, Any]:
         label1, label2 = kwargs['candidate']
         preset_boolean = kwargs['preset_boolean']
 
-        label1_instances = self.scene_data.get_instances_by_label(label1)
-        label2_instances = self.scene_data.get_instances_by_label(label2)
-        label1_inst_count = len(label1_instances)
-        label2_inst_count = len(label2_instances)
-
-        # find all relations that yield the intended boolean
-        valid_relations = [
-            rel for rel, info in QUANTITY_COMPARE_FV_RELATION_DICT.items()
-            if info['func'](label1_inst_count, label2_inst_count) == preset_boolean
-        ]
-        if valid_relations:
-            relation = random.choice(valid_relations)
-        else:
-            # fallback to a random relation and then swap with its contrapositive
-            relation = random.choice(
-                list(QUANTITY_COMPARE_FV_RELATION_DICT.keys()))
-            if QUANTITY_COMPARE_FV_RELATION_DICT[relation]['func'](
-                    label1_inst_count, label2_inst_count) != preset_boolean:
-                relation = QUANTITY_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
+        label1_inst_count = self.scene_artefacts.label_counts[label1]
+        label2_inst_count = self.scene_artefacts.label_counts[label2]
+
+        # the relation is given in stratified mode, otherwise it is chosen to match the intended boolean
+        relation = kwargs.get('relation')
+        if relation is None:
+            # find all relations that yield the intended boolean
+            valid_relations = [
+                rel for rel, info in QUANTITY_COMPARE_FV_RELATION_DICT.items()
+                if info['func'](label1_inst_count, label2_inst_count) == preset_boolean
+            ]
+            if valid_relations:
+                relation = self.rng.choice(valid_relations)
+            else:
+                # fallback to a random relation and then swap with its contrapositive
+                relation = self.rng.choice(
+                    list(QUANTITY_COMPARE_FV_RELATION_DICT.keys()))
+                if QUANTITY_COMPARE_FV_RELATION_DICT[relation]['func'](
+                        label1_inst_count, label2_inst_count) != preset_boolean:
+                    relation = QUANTITY_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # determine the contrapositive relation for the proposition
         contrapositive_relation = QUANTITY_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # prepare the main proposition text
         base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 QUANTITY_COMPARE_FV_RELATION_DICT[relation]['templates'])
             .replace('<OBJ1>', label1)
             .replace('<OBJ2>', label2)
         )
         prompt_caption = 'yes' if preset_boolean else 'no'
-        base_prompt_suffix_text = random.choice(PROMPT_FV_HINT_TEMPLATES)
+        base_prompt_suffix_text = self.rng.choice(PROMPT_FV_HINT_TEMPLATES)
 
         # prepare the contrapositive proposition text
         cp_base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 QUANTITY_COMPARE_FV_RELATION_DICT[contrapositive_relation]['templates'])
             .replace('<OBJ1>', label1)
             .replace('<OBJ2>', label2)
@@ -157,12 +169,12 @@ class QuantityCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin)
             'meta': {
                 'label1': {
                     'label': label1,
-                    'ids': [inst.object_id for inst in label1_instances],
+                    'ids': self.scene_artefacts.get_label_object_ids(label1),
                     'count': label1_inst_count,
                 },
                 'label2': {
                     'label': label2,
-                    'ids': [inst.object_id for inst in label2_instances],
+                    'ids': self.scene_artefacts.get_label_object_ids(label2),
                     'count': label2_inst_count,
                 },
                 'relation': relation,
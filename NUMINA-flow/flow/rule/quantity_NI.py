@@ -1,4 +1,3 @@
-import random
 from typing import List, Dict, Any
 
 from .base.base import (
@@ -28,24 +27,24 @@ class QuantityNIGenerator(NumericalInferenceMixin, SingleObjectCandidateMixin):
         self.allow_repeated_objects = True
 
     def _get_candidates(self) -> List[str]:
-        return list(set(
+        # deduplicated in order of appearance, so that the candidates do not depend on the string hash seed
+        return list(dict.fromkeys(
             inst.label for inst in super()._get_candidates()
         ))
 
     def _form_question_dict(self, **kwargs) -> Dict[str, Any]:
         label = kwargs['candidate']
-        instances = self.scene_data.get_instances_by_label(label)
-        obj_count = len(instances)
+        obj_count = self.scene_artefacts.label_counts[label]
 
         return {
             'meta': {
                 'label': label,
-                'obj_ids': [inst.object_id for inst in instances],
+                'obj_ids': self.scene_artefacts.get_label_object_ids(label),
             },
             'prompt': (
-                random.choice(COUNT_NI_TEMPLATES)
+                self.rng.choice(COUNT_NI_TEMPLATES)
                 .replace('<OBJ>', label)
-                + random.choice(PROMPT_NI_HINT_TEMPLATES)
+                + self.rng.choice(PROMPT_NI_HINT_TEMPLATES)
             ),
             'caption': str(obj_count),
             'ref_captions': [obj_count],
@@ -1,5 +1,6 @@
-import random
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+import numpy as np
 
 from .base.base import (
     DualObjectsCandidateMixin, FactValidationMixin
@@ -55,7 +56,7 @@ VOLUME_COMPARE_FV_RELATION_DICT = {
     },
     '=': {
         # relative error <= 5%
-        'func': lambda x, y: abs(x - y) <= 0.05 * max(x, y),
+        'func': lambda x, y: np.abs(x - y) <= 0.05 * np.maximum(x, y),
         'text': 'approximately equal to',
         'templates': [
             'Is the volume of the bounding box of <OBJ1> approximately equal to the volume of the bounding box of <OBJ2>? ',
@@ -65,7 +66,7 @@ VOLUME_COMPARE_FV_RELATION_DICT = {
         'contrapositive': '!=',
     },
     '!=': {
-        'func': lambda x, y: abs(x - y) > 0.05 * max(x, y),
+        'func': lambda x, y: np.abs(x - y) > 0.05 * np.maximum(x, y),
         'text': 'not approximately equal to',
         'templates': [
             'Is the volume of the bounding box of <OBJ1> not approximately equal to the volume of the bounding box of <OBJ2>? ',
@@ -83,6 +84,8 @@ Therefore, the answer is <<ANSWER>>."""
 
 
 class VolumeCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin):
+    RELATION_DICT = VOLUME_COMPARE_FV_RELATION_DICT
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.question_type = 'RULE-volume_compare-FV'
@@ -99,6 +102,13 @@ class VolumeCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin):
             return False
         return True
 
+    def _get_relation_operands(self, candidates: List) -> tuple[np.ndarray, np.ndarray]:
+        # bounding box volumes of the two instances of each candidate
+        return (
+            np.array([inst1.bbox_volume for inst1, _ in candidates], dtype=np.float64),
+            np.array([inst2.bbox_volume for _, inst2 in candidates], dtype=np.float64),
+        )
+
     def _form_question_dict(self, **kwargs) -> Dict[str, Any]:
         inst1, inst2 = kwargs['candidate']
         preset_boolean = kwargs['preset_boolean']
@@ -106,37 +116,40 @@ class VolumeCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin):
         inst1_label, inst1_bbox_volume = inst1.label, inst1.bbox_volume
         inst2_label, inst2_bbox_volume = inst2.label, inst2.bbox_volume
 
-        # find all relations that yield the intended boolean
-        valid_relations = [
-            rel for rel, info in VOLUME_COMPARE_FV_RELATION_DICT.items()
-            if info['func'](inst1_bbox_volume, inst2_bbox_volume) == preset_boolean
-        ]
-        if valid_relations:
-            relation = random.choice(valid_relations)
-        else:
-            # fallback to a random relation and then swap with its contrapositive
-            relation = random.choice(
-                list(VOLUME_COMPARE_FV_RELATION_DICT.keys()))
-            if VOLUME_COMPARE_FV_RELATION_DICT[relation]['func'](
-                    inst1_bbox_volume, inst2_bbox_volume) != preset_boolean:
-                relation = VOLUME_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
+        # the relation is given in stratified mode, otherwise it is chosen to match the intended boolean
+        relation = kwargs.get('relation')
+        if relation is None:
+            # find all relations that yield the intended boolean
+            valid_relations = [
+                rel for rel, info in VOLUME_COMPARE_FV_RELATION_DICT.items()
+                if info['func'](inst1_bbox_volume, inst2_bbox_volume) == preset_boolean
+            ]
+            if valid_relations:
+                relation = self.rng.choice(valid_relations)
+            else:
+                # fallback to a random relation and then swap with its contrapositive
+                relation = self.rng.choice(
+                    list(VOLUME_COMPARE_FV_RELATION_DICT.keys()))
+                if VOLUME_COMPARE_FV_RELATION_DICT[relation]['func'](
+                        inst1_bbox_volume, inst2_bbox_volume) != preset_boolean:
+                    relation = VOLUME_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # determine the contrapositive relation for the proposition
         contrapositive_relation = VOLUME_COMPARE_FV_RELATION_DICT[relation]['contrapositive']
 
         # prepare the main proposition text
         base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 VOLUME_COMPARE_FV_RELATION_DICT[relation]['templates'])
             .replace('<OBJ1>', inst1_label)
             .replace('<OBJ2>', inst2_label)
         )
         prompt_caption = 'yes' if preset_boolean else 'no'
-        base_prompt_suffix_text = random.choice(PROMPT_FV_HINT_TEMPLATES)
+        base_prompt_suffix_text = self.rng.choice(PROMPT_FV_HINT_TEMPLATES)
 
         # prepare the contrapositive proposition text
         cp_base_prompt_text = (
-            random.choice(
+            self.rng.choice(
                 VOLUME_COMPARE_FV_RELATION_DICT[contrapositive_relation]['templates'])
             .replace('<OBJ1>', inst1_label)
             .replace('<OBJ2>', inst2_label)
@@ -157,19 +170,13 @@ class VolumeCompareFVGenerator(FactValidationMixin, DualObjectsCandidateMixin):
             'meta': {
                 'label1': {
                     'label': inst1_label,
-                    'id': [
-                        inst.object_id
-                        for inst in self.scene_data.get_instances_by_label(inst1_label)
-                    ],
+                    'id': self.scene_artefacts.get_label_object_ids(inst1_label),
                     'bbox_xyz_len': inst1.bbox_xyz_len,
                     'bbox_volume': inst1_bbox_volume,
                 },
                 'label2': {
                     'label': inst2_label,
-                    'id': [
-                        inst.object_id
-                        for inst in self.scene_data.get_instances_by_label(inst2_label)
-                    ],
+                    'id': self.scene_artefacts.get_label_object_ids(inst2_label),
                     'bbox_xyz_len': inst2.bbox_xyz_len,
                     'bbox_volume': inst2_bbox_volume,
                 },
@@ -1,4 +1,3 @@
-import random
 from typing import Dict, Any
 
 from .base.base import (
@@ -45,21 +44,20 @@ class VolumeNIGenerator(NumericalInferenceMixin, SingleObjectCandidateMixin):
 
         # prepare the main proposition text
         base_prompt_text = (
-            random.choice(VOLUME_NI_TEMPLATES)
+            self.rng.choice(VOLUME_NI_TEMPLATES)
             .replace('<OBJ>', label)
         )
 
         return {
             'meta': {
                 'label': label,
-                'id': [inst.object_id
-                       for inst in self.scene_data.get_instances_by_label(label)],
+                'id': self.scene_artefacts.get_label_object_ids(label),
                 'bbox_xyz_min': instance.bbox_xyz_min,
                 'bbox_xyz_max': instance.bbox_xyz_max,
                 'bbox_xyz_len': instance.bbox_xyz_len,
                 'bbox_volume': instance.bbox_volume,
             },
-            'prompt': base_prompt_text + random.choice(PROMPT_NI_HINT_TEMPLATES),
+            'prompt': base_prompt_text + self.rng.choice(PROMPT_NI_HINT_TEMPLATES),
             'CoT_prompt': base_prompt_text + PROMPT_NI_CoT_HINT_TEMPLATE,
             'caption': f'{round(instance.bbox_volume, 3):.2f}',
             'CoT_caption': (
@@ -1,5 +1,8 @@
 import os
 import re
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
 
 
 def _cleanup_response(response: str) -> str:
@@ -7,45 +10,127 @@ def _cleanup_response(response: str) -> str:
     return re.sub(r'[\u4e00-\u9fff]+', '', response).replace('\n', ' ').replace('\r', '')
 
 
-def _chat_ollama(request_text: str, llm_model: str = 'qwen2.5:72b') -> str:
+class LLMBackend(ABC):
+    """Long-lived chat client of an LLM model, whose HTTP connections are kept alive and pooled
+
+    A backend is thread-safe and meant to be shared by all requests to the same model and server,
+    see get_llm_backend.
+    """
+
+    def __init__(self, llm_model: str, base_url: Optional[str] = None) -> None:
+        self.llm_model = llm_model
+        self.base_url = base_url
+
+    @abstractmethod
+    def chat(self, request_text: str) -> str:
+        """Send a single-turn chat request and return the cleaned-up response"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Close the connections of the client"""
+        pass
+
+
+class OllamaBackend(LLMBackend):
     """Chat with LLM models hosted by ollama"""
-    import ollama
-    response = ollama.chat(
-        model=llm_model,
-        messages=[{'role': 'user', 'content': request_text}]
-    )
-    return _cleanup_response(response['message']['content'])
 
+    def __init__(self, llm_model: str = 'qwen2.5:72b', base_url: Optional[str] = None) -> None:
+        import httpx
+        import ollama
+
+        super().__init__(llm_model, base_url)
+        # the connection pool is owned here and handed to the httpx client that ollama creates, so that it
+        # can be closed without a close() on the ollama client
+        self._transport = httpx.HTTPTransport()
+        # the host defaults to $OLLAMA_HOST, or the local server
+        self.client = ollama.Client(host=base_url, transport=self._transport)
 
-def _chat_openai(request_text: str, llm_model: str = 'gpt-4o-mini-2024-07-18') -> str:
+    def chat(self, request_text: str) -> str:
+        response = self.client.chat(
+            model=self.llm_model,
+            messages=[{'role': 'user', 'content': request_text}]
+        )
+        return _cleanup_response(response['message']['content'])
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class OpenAIBackend(LLMBackend):
     """Chat with LLM models compatible with OpenAI API"""
-    from openai import OpenAI
-    from dotenv import load_dotenv
 
-    load_dotenv()
+    def __init__(self, llm_model: str = 'gpt-4o-mini-2024-07-18', base_url: Optional[str] = None) -> None:
+        from openai import OpenAI
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+        super().__init__(llm_model, base_url or os.getenv('OPENAI_BASE_URL'))
+        self.client = OpenAI(
+            base_url=self.base_url,
+            api_key=os.getenv('OPENAI_API_KEY')
+        )
+
+    def chat(self, request_text: str) -> str:
+        response = self.client.chat.completions.create(
+            model=self.llm_model,
+            messages=[{"role": "user", "content": request_text}]
+        )
+        return _cleanup_response(response.choices[0].message.content)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+LLM_BACKENDS = {'ollama': OllamaBackend, 'openai': OpenAIBackend}
+
+
+class LLMBackendRegistry:
+    """Process-wide registry of LLM backends, one per (backend, model, base URL)
+
+    The backends are created on first use and reused by all requests and threads, so that each request
+    only costs the round trip to the server. Close them with close() once done, e.g., at the end of a run.
+    """
+
+    def __init__(self) -> None:
+        self._backends: Dict[Tuple[str, str, Optional[str]], LLMBackend] = {}
+        self._lock = threading.Lock()
+
+    def get(self, llm_backend: str, llm_model: str, base_url: Optional[str] = None) -> LLMBackend:
+        """Get the backend of a model, creating it if needed"""
+        if llm_backend not in LLM_BACKENDS:
+            raise ValueError(f'Invalid backend specified. Must be one of {list(LLM_BACKENDS)}')
+        key = (llm_backend, llm_model, base_url)
+        with self._lock:
+            if key not in self._backends:
+                self._backends[key] = LLM_BACKENDS[llm_backend](llm_model, base_url)
+            return self._backends[key]
+
+    def close(self) -> None:
+        """Close and forget all backends, which are created again on next use"""
+        with self._lock:
+            for backend in self._backends.values():
+                backend.close()
+            self._backends.clear()
+
+    def __len__(self) -> int:
+        return len(self._backends)
+
+
+# registry shared by everything chatting with LLMs in this process
+LLM_BACKEND_REGISTRY = LLMBackendRegistry()
+
 
-    client = OpenAI(
-        base_url=os.getenv('OPENAI_BASE_URL'),
-        api_key=os.getenv('OPENAI_API_KEY')
-    )
-    response = client.chat.completions.create(
-        model=llm_model,
-        messages=[{"role": "user", "content": request_text}]
-    )
-    return _cleanup_response(response.choices[0].message.content)
+def get_llm_backend(llm_backend: str, llm_model: str, base_url: Optional[str] = None) -> LLMBackend:
+    """Get a backend through the process-wide registry"""
+    return LLM_BACKEND_REGISTRY.get(llm_backend, llm_model, base_url)
 
 
 def chat_with_llm(
         request_text: str,
         llm_model: str = 'qwen2.5:72b',
         llm_backend: str = 'ollama',
+        base_url: Optional[str] = None,
 ) -> str:
     """Helper function for LLM chatting"""
-    match llm_backend:
-        case 'ollama':
-            return _chat_ollama(request_text, llm_model)
-        case 'openai':
-            return _chat_openai(request_text, llm_model)
-        case _:
-            raise ValueError(
-                'Invalid backend specified. Must be either "ollama" or "openai"')
+    return get_llm_backend(llm_backend, llm_model, base_url).chat(request_text)
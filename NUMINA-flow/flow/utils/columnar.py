@@ -0,0 +1,194 @@
+import json
+import struct
+import zipfile
+from collections.abc import Mapping
+from functools import cached_property
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from .io import open_atomically
+
+# instance-level columns of the columnar scene statistics, and their scene statistics JSON keys
+INSTANCE_COLUMNS = {
+    'object_ids': 'object_id',
+    'labels': 'label',
+    'centers': 'center',
+    'bbox_xyz_mins': 'bbox_xyz_min',
+    'bbox_xyz_maxs': 'bbox_xyz_max',
+    'bbox_xyz_lens': 'bbox_xyz_len',
+    'bbox_volumes': 'bbox_volume',
+}
+_NPY_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+# size of the fixed part of a ZIP local file header
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def build_distance_matrix(object_ids: List[int | str], pairwise_distances: Mapping[str, float]) -> np.ndarray:
+    """Symmetric distance matrix of "id1-id2" pairwise distances, with rows in the order of the object IDs
+
+    Missing pairwise distances (and the diagonal) are NaN. The matrix of a PairwiseDistanceMap is returned
+    as is, i.e. read-only, if its rows are already in order.
+    """
+    if isinstance(pairwise_distances, PairwiseDistanceMap):
+        # reorder the rows of the underlying matrix instead of going through every pair
+        rows = [pairwise_distances.id_to_row.get(str(object_id)) for object_id in object_ids]
+        if all(row is not None for row in rows):
+            matrix = pairwise_distances.distance_matrix
+            # rows already in order (always the case for analyzer exports): keep the (memory-mapped) matrix
+            # as is instead of copying it into memory
+            if rows == list(range(len(matrix))) and matrix.dtype == np.float64:
+                return matrix
+            return np.array(matrix[np.ix_(rows, rows)], dtype=np.float64)
+    id_to_row = {int(object_id): row for row, object_id in enumerate(object_ids)}
+    distance_matrix = np.full((len(object_ids), len(object_ids)), np.nan, dtype=np.float64)
+    for key, dist in pairwise_distances.items():
+        row1, row2 = (id_to_row[int(obj_id)] for obj_id in key.split('-'))
+        distance_matrix[row1, row2] = distance_matrix[row2, row1] = dist
+    return distance_matrix
+
+
+def export_scene_stats_as_npz_file(scene_stats: Dict[str, Any], npz_file_path: str) -> None:
+    """Export scene statistics as an uncompressed NPZ file of instance columns and a dense distance matrix
+
+    Missing pairwise distances (and the diagonal) are stored as NaN. The settings of a neighbour graph,
+    if any, are kept as a JSON string.
+    """
+    instances = scene_stats['instances']
+    object_ids = [int(inst['object_id']) for inst in instances]
+    distance_matrix = build_distance_matrix(object_ids, scene_stats['pairwise_distances'])
+
+    def instance_column(key: str, dtype: type, shape: tuple = ()) -> np.ndarray:
+        return np.array([inst[key] for inst in instances], dtype=dtype).reshape(len(instances), *shape)
+
+    columns = {
+        'object_ids': np.array(object_ids, dtype=np.int64),
+        'labels': instance_column('label', np.str_),
+        'centers': instance_column('center', np.float64, (3,)),
+        'bbox_xyz_mins': instance_column('bbox_xyz_min', np.float64, (3,)),
+        'bbox_xyz_maxs': instance_column('bbox_xyz_max', np.float64, (3,)),
+        'bbox_xyz_lens': instance_column('bbox_xyz_len', np.float64, (3,)),
+        'bbox_volumes': instance_column('bbox_volume', np.float64),
+    }
+    if 'pairwise_distance_graph' in scene_stats:
+        columns['pairwise_distance_graph'] = np.array(json.dumps(scene_stats['pairwise_distance_graph']))
+    with open_atomically(npz_file_path, 'wb') as f:
+        # members are stored without compression so that they can be memory-mapped
+        np.savez(
+            f,
+            scene_id=np.array(scene_stats['scene_id']),
+            unique_labels=np.array(scene_stats['unique_labels'], dtype=np.str_),
+            pairwise_distances=distance_matrix,
+            **columns,
+        )
+
+
+def load_npz_file_mmap(npz_file_path: str) -> Dict[str, np.ndarray]:
+    """Load the arrays of an NPZ file, memory-mapping every uncompressed non-scalar member"""
+    arrays = {}
+    with zipfile.ZipFile(npz_file_path) as zf, open(npz_file_path, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename.removesuffix('.npy')
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.lib.format.read_array(zf.open(info))
+                continue
+            # locate the member data behind its local file header
+            f.seek(info.header_offset)
+            local_header = f.read(_ZIP_LOCAL_HEADER_SIZE)
+            name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + _ZIP_LOCAL_HEADER_SIZE + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version not in _NPY_HEADER_READERS:
+                arrays[name] = np.lib.format.read_array(zf.open(info))
+                continue
+            shape, fortran_order, dtype = _NPY_HEADER_READERS[version](f)
+            if dtype.hasobject or np.prod(shape) == 0 or shape == ():
+                arrays[name] = np.lib.format.read_array(zf.open(info))
+            else:
+                arrays[name] = np.memmap(npz_file_path, dtype=dtype, mode='r', offset=f.tell(),
+                                         shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+class PairwiseDistanceMap(Mapping):
+    """Read-only "id1-id2" -> distance mapping backed by a dense distance matrix
+
+    Keys and iteration order follow the "pairwise_distances" of the scene statistics JSON.
+    """
+
+    def __init__(self, object_ids: np.ndarray, distance_matrix: np.ndarray) -> None:
+        self._object_ids = [str(obj_id) for obj_id in object_ids.tolist()]
+        self._id_to_row = {obj_id: row for row, obj_id in enumerate(self._object_ids)}
+        self._distance_matrix = distance_matrix
+
+    @property
+    def id_to_row(self) -> Dict[str, int]:
+        """Row of each object ID in the distance matrix"""
+        return self._id_to_row
+
+    @property
+    def distance_matrix(self) -> np.ndarray:
+        return self._distance_matrix
+
+    @cached_property
+    def _pairs(self) -> np.ndarray:
+        """Row indices of the pairs with a distance, ordered by their object IDs as in the JSON export"""
+        object_ids = np.array([int(obj_id) for obj_id in self._object_ids], dtype=np.int64)
+        rows1, rows2 = np.nonzero(np.triu(~np.isnan(self._distance_matrix), k=1))
+        order = np.lexsort((object_ids[rows2], object_ids[rows1]))
+        return np.stack([rows1[order], rows2[order]], axis=1)
+
+    def _parse_key(self, key: str) -> tuple[int, int] | None:
+        obj_id1, _, obj_id2 = key.partition('-') if isinstance(key, str) else ('', '', '')
+        if obj_id1 not in self._id_to_row or obj_id2 not in self._id_to_row:
+            return None
+        row1, row2 = self._id_to_row[obj_id1], self._id_to_row[obj_id2]
+        return (row1, row2) if row1 < row2 and not np.isnan(self._distance_matrix[row1, row2]) else None
+
+    def __getitem__(self, key: str) -> float:
+        rows = self._parse_key(key)
+        if rows is None:
+            raise KeyError(key)
+        return float(self._distance_matrix[rows])
+
+    def __contains__(self, key: object) -> bool:
+        return self._parse_key(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (f'{self._object_ids[row1]}-{self._object_ids[row2]}' for row1, row2 in self._pairs.tolist())
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+
+def load_scene_stats_npz_file(npz_file_path: str) -> Dict[str, Any]:
+    """Load columnar scene statistics in the layout of the scene statistics JSON
+
+    Instance columns and the distance matrix stay memory-mapped, and "pairwise_distances" is a
+    read-only mapping over the matrix instead of a dict.
+    """
+    arrays = load_npz_file_mmap(npz_file_path)
+    instances = [
+        dict(zip(INSTANCE_COLUMNS.values(), values))
+        for values in zip(*(arrays[column].tolist() for column in INSTANCE_COLUMNS))
+    ]
+    labels = arrays['labels'].tolist()
+    scene_stats = {
+        'scene_id': str(arrays['scene_id']),
+        'num_instances': len(instances),
+        'unique_labels': arrays['unique_labels'].tolist(),
+        'instance_map': {
+            label: [inst['object_id'] for inst in instances if inst['label'] == label]
+            for label in dict.fromkeys(labels)
+        },
+        'object_map': {str(inst['object_id']): inst['label'] for inst in instances},
+        'instances': instances,
+        'pairwise_distances': PairwiseDistanceMap(arrays['object_ids'], arrays['pairwise_distances']),
+    }
+    if 'pairwise_distance_graph' in arrays:
+        scene_stats['pairwise_distance_graph'] = json.loads(str(arrays['pairwise_distance_graph']))
+    return scene_stats
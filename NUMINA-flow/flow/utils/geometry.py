@@ -0,0 +1,215 @@
+import heapq
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from scipy.spatial import ConvexHull, cKDTree
+
+# relative slack on the pruning bound to absorb floating-point rounding
+_BOUND_RTOL = 1e-9
+# relative convergence tolerance and iteration cap of the GJK distance algorithm
+_GJK_RTOL = 1e-10
+_GJK_MAX_ITER = 128
+
+
+def aabb_point_distances(points: np.ndarray, bbox_min: np.ndarray, bbox_max: np.ndarray) -> np.ndarray:
+    """Distances from each point to an axis-aligned bounding box (0 for points inside)"""
+    return np.linalg.norm(np.maximum(np.maximum(bbox_min - points, points - bbox_max), 0), axis=1)
+
+
+def aabb_distances(
+        bbox_min: np.ndarray, bbox_max: np.ndarray, bbox_mins: np.ndarray, bbox_maxs: np.ndarray
+) -> np.ndarray:
+    """Distances from an axis-aligned bounding box to each of the given ones (0 for overlapping boxes)"""
+    return np.linalg.norm(np.maximum(np.maximum(bbox_min - bbox_maxs, bbox_mins - bbox_max), 0), axis=-1)
+
+
+def _closest_point_on_simplex(simplex: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Closest point to the origin on a simplex of up to 4 points, and the sub-simplex supporting it"""
+    best_point, best_support = None, None
+    # brute force over the faces of the simplex that contain the newest (last) point,
+    # as the closest point of a GJK simplex always lies on one of them
+    for n_points in range(len(simplex)):
+        for subset in combinations(range(len(simplex) - 1), n_points):
+            points = simplex[[len(simplex) - 1, *subset]]
+            # affine projection of the origin: p0 + D @ mu minimising the norm
+            edges = (points[1:] - points[0]).T
+            if n_points > 0:
+                gram = edges.T @ edges
+                if np.linalg.det(gram) <= 1e-12 * np.prod(np.diag(gram)):
+                    continue
+                mu = np.linalg.solve(gram, -edges.T @ points[0])
+                if np.any(mu < 0) or mu.sum() > 1:
+                    continue
+                point = points[0] + edges @ mu
+            else:
+                point = points[0]
+            if best_point is None or point @ point < best_point @ best_point:
+                best_point, best_support = point, points
+    return best_point, best_support
+
+
+def gjk_distance(points1: np.ndarray, points2: np.ndarray) -> float:
+    """Exact distance between the convex hulls of two point sets with the GJK algorithm
+
+    Returns 0 if the convex hulls intersect.
+    """
+    def support(direction: np.ndarray) -> np.ndarray:
+        # support point of the Minkowski difference (points1 - points2) along the direction
+        return points1[np.argmax(points1 @ direction)] - points2[np.argmin(points2 @ direction)]
+
+    point = points1[0] - points2[0]
+    simplex = point[None, :]
+    for _ in range(_GJK_MAX_ITER):
+        sq_dist = point @ point
+        if sq_dist == 0:
+            return 0.
+        new_point = support(-point)
+        # stop once the support point no longer brings the simplex closer to the origin
+        if sq_dist - point @ new_point <= _GJK_RTOL * sq_dist or any(np.all(simplex == new_point, axis=1)):
+            break
+        point, simplex = _closest_point_on_simplex(np.vstack([simplex, new_point]))
+        # a full tetrahedron means the origin is enclosed, i.e. the hulls intersect
+        if len(simplex) == 4:
+            return 0.
+    return float(np.sqrt(point @ point))
+
+
+def build_hull_vertices(point_sets: List[np.ndarray]) -> tuple[List[Optional[np.ndarray]], Dict[int, str]]:
+    """Convex hull vertices of each point set (None if the hull cannot be built), and the errors by index"""
+    hull_vertices, hull_errors = [], {}
+    for idx, points in enumerate(point_sets):
+        try:
+            hull_vertices.append(points[ConvexHull(points).vertices])
+        except Exception as e:
+            hull_vertices.append(None)
+            hull_errors[idx] = str(e)
+    return hull_vertices, hull_errors
+
+
+class SurfaceDistanceEngine:
+    """Pairwise surface distances between point sets, measured on their convex hulls
+
+    Each convex hull is built once per point set, and every computed distance is cached, so that
+    distances can also be requested on demand. Two distance modes are supported:
+    - "vertex": minimum distance between the convex hull vertices. The vertices of one hull are pruned
+      with their distance to the other hull's bounding box before the remaining ones are queried
+      against a KD-tree over the other hull's vertices.
+    - "hull": exact distance between the convex hulls, computed with the GJK algorithm.
+    """
+    DISTANCE_MODES = ['vertex', 'hull']
+
+    def __init__(self, point_sets: List[np.ndarray], mode: str = 'vertex') -> None:
+        self._init_hulls(*build_hull_vertices(point_sets), mode)
+
+    @classmethod
+    def from_hull_vertices(
+            cls, hull_vertices: List[Optional[np.ndarray]], hull_errors: Dict[int, str], mode: str = 'vertex'
+    ) -> 'SurfaceDistanceEngine':
+        """Engine over convex hulls built beforehand (see build_hull_vertices), e.g., shared between processes"""
+        engine = cls.__new__(cls)
+        engine._init_hulls(list(hull_vertices), dict(hull_errors), mode)
+        return engine
+
+    def _init_hulls(
+            self, hull_vertices: List[Optional[np.ndarray]], hull_errors: Dict[int, str], mode: str
+    ) -> None:
+        if mode not in self.DISTANCE_MODES:
+            raise ValueError(f'Invalid distance mode: {mode}. Must be one of {self.DISTANCE_MODES}')
+        self.mode = mode
+        self.hull_vertices = hull_vertices
+        self.hull_errors = hull_errors
+        self._trees = [cKDTree(v) if v is not None else None for v in self.hull_vertices]
+        self.bbox_mins = [v.min(axis=0) if v is not None else None for v in self.hull_vertices]
+        self.bbox_maxs = [v.max(axis=0) if v is not None else None for v in self.hull_vertices]
+        self._distance_cache: Dict[tuple[int, int], float] = {}
+
+    def __len__(self) -> int:
+        return len(self.hull_vertices)
+
+    def is_valid(self, idx: int) -> bool:
+        """Whether the convex hull of the point set could be built"""
+        return self.hull_vertices[idx] is not None
+
+    def distance(self, idx1: int, idx2: int) -> float:
+        """Surface distance between two point sets"""
+        if not self.is_valid(idx1) or not self.is_valid(idx2):
+            raise ValueError(f'No convex hull for point set {idx1 if not self.is_valid(idx1) else idx2}: '
+                             f'{self.hull_errors.get(idx1, self.hull_errors.get(idx2))}')
+        key = (min(idx1, idx2), max(idx1, idx2))
+        if key not in self._distance_cache:
+            self._distance_cache[key] = (
+                gjk_distance(self.hull_vertices[idx1], self.hull_vertices[idx2])
+                if self.mode == 'hull' else
+                self._vertex_distance(idx1, idx2)
+            )
+        return self._distance_cache[key]
+
+    def _vertex_distance(self, idx1: int, idx2: int) -> float:
+        """Minimum distance between the convex hull vertices of two point sets"""
+        # query the smaller vertex set against the KD-tree of the larger one
+        if len(self.hull_vertices[idx1]) > len(self.hull_vertices[idx2]):
+            idx1, idx2 = idx2, idx1
+        query_vertices, tree = self.hull_vertices[idx1], self._trees[idx2]
+
+        # any real vertex distance is an upper bound; take the vertex closest to the other bounding box
+        lower_bounds = aabb_point_distances(query_vertices, self.bbox_mins[idx2], self.bbox_maxs[idx2])
+        upper_bound = tree.query(query_vertices[np.argmin(lower_bounds)])[0]
+        # vertices farther from the bounding box than the upper bound cannot be the closest ones
+        candidates = query_vertices[lower_bounds <= upper_bound * (1 + _BOUND_RTOL)]
+        return float(min(upper_bound, np.min(tree.query(candidates)[0])))
+
+    def pairwise_distances(self, idx1s: Optional[Iterable[int]] = None) -> Dict[tuple[int, int], float]:
+        """Distances between all pairs of point sets with valid convex hulls
+
+        If idx1s is given, only the pairs (idx1, idx2) with idx1 in idx1s and idx2 > idx1 are calculated.
+        """
+        return {
+            (idx1, idx2): self.distance(idx1, idx2)
+            for idx1 in (range(len(self)) if idx1s is None else idx1s) if self.is_valid(idx1)
+            for idx2 in range(idx1 + 1, len(self)) if self.is_valid(idx2)
+        }
+
+    def neighbor_graph(
+            self, radius: Optional[float] = None, k: Optional[int] = None
+    ) -> Dict[tuple[int, int], float]:
+        """Distances of the pairs within the radius, plus those between each point set and its k nearest ones
+
+        Surface distances are bounded from below by the distances between bounding boxes. Radius candidates
+        come from a KD-tree over the bounding box centers, and the k nearest neighbours of each point set
+        are searched best-first in order of bounding box distance, so only O(N * k) surface distances are
+        computed for scenes where few objects are close to each other.
+        """
+        valid_idxs = np.array([idx for idx in range(len(self)) if self.is_valid(idx)], dtype=np.int64)
+        if len(valid_idxs) < 2:
+            return {}
+        bbox_mins = np.array([self.bbox_mins[idx] for idx in valid_idxs])
+        bbox_maxs = np.array([self.bbox_maxs[idx] for idx in valid_idxs])
+        pairs = set()
+
+        if radius is not None:
+            # bounding boxes within the radius have centers within the radius plus both half diagonals
+            half_diagonals = np.linalg.norm(bbox_maxs - bbox_mins, axis=1) / 2
+            center_tree = cKDTree((bbox_mins + bbox_maxs) / 2)
+            for row1, row2 in center_tree.query_pairs(radius + 2 * half_diagonals.max()):
+                idx1, idx2 = valid_idxs[row1], valid_idxs[row2]
+                if (aabb_distances(bbox_mins[row1], bbox_maxs[row1], bbox_mins[row2], bbox_maxs[row2]) <= radius
+                        and self.distance(idx1, idx2) <= radius):
+                    pairs.add((min(idx1, idx2), max(idx1, idx2)))
+
+        if k is not None:
+            for row, idx in enumerate(valid_idxs):
+                lower_bounds = aabb_distances(bbox_mins[row], bbox_maxs[row], bbox_mins, bbox_maxs)
+                lower_bounds[row] = np.inf
+                # max-heap of the k nearest neighbours found so far
+                nearest = []
+                for neighbor_row in np.argsort(lower_bounds, kind='stable')[:-1]:
+                    if len(nearest) == k and lower_bounds[neighbor_row] > -nearest[0][0]:
+                        break
+                    neighbor_idx = valid_idxs[neighbor_row]
+                    heapq.heappush(nearest, (-self.distance(idx, neighbor_idx), -neighbor_idx))
+                    if len(nearest) > k:
+                        heapq.heappop(nearest)
+                pairs.update((min(idx, -neg_idx), max(idx, -neg_idx)) for _, neg_idx in nearest)
+
+        return {(int(idx1), int(idx2)): self.distance(idx1, idx2) for idx1, idx2 in sorted(pairs)}
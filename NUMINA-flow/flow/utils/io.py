@@ -1,9 +1,21 @@
 import json
 import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
+from typing import IO, Any, Callable, Iterator, List, Optional
 
 import click
-from filelock import FileLock
+from filelock import FileLock, Timeout
+
+try:
+    import fcntl
+except ImportError:
+    # e.g., on Windows, where FileLock removes its lock file on release anyway
+    fcntl = None
 
 
 def enum_files(
@@ -49,6 +61,31 @@ def parse_json_text(
     return data_dict
 
 
+def parse_json_array_text(
+        json_text: str, required_fields: list[str], n_items: int,
+) -> list[Optional[dict]]:
+    """Parse the JSON text as an array of n_items dictionaries, None for the invalid ones
+
+    An array of another length is rejected as a whole, as its items can no longer be matched by position.
+    """
+    try:
+        json_data = json.loads(json_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid JSON format: {e}')
+    if not isinstance(json_data, list):
+        raise ValueError(f'Expected a JSON array, got {type(json_data).__name__}')
+    if len(json_data) != n_items:
+        raise ValueError(f'Expected a JSON array of {n_items} items, got {len(json_data)}')
+
+    data_dicts = []
+    for item in json_data:
+        if isinstance(item, dict) and all(field in item for field in required_fields):
+            data_dicts.append({field: item[field] for field in required_fields})
+        else:
+            data_dicts.append(None)
+    return data_dicts
+
+
 def load_json_file_as_dict(
         json_file_path: str, is_strict: bool = False
 ) -> dict:
@@ -69,10 +106,8 @@ def export_dict_as_json_file(
 ) -> None:
     """Export the JSON file incrementally"""
     os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
-    lock_path = json_file_path + '.lock'
-    lock = FileLock(lock_path)
 
-    with lock:
+    with lock_json_file(json_file_path):
         # if JSON file does not exist or empty, export the data as JSON file
         if not os.path.isfile(json_file_path) or os.path.getsize(json_file_path) == 0:
             with open(json_file_path, 'w', encoding='utf-8') as f:
@@ -94,6 +129,215 @@ def export_dict_as_json_file(
                 raise ValueError(f'Invalid JSON format in {json_file_path}: {e}')
 
 
+@contextmanager
+def lock_json_file(json_file_path: str, timeout: Optional[float] = None, remove: bool = False) -> Iterator[None]:
+    """Hold the lock of a JSON file (its ".lock" file) across processes, optionally removing the lock file
+
+    The lock file may be removed by its holder: a waiter that then acquires the removed file notices it is no
+    longer the lock file of the JSON file and locks the current one instead. Raises Timeout after timeout
+    seconds, if given.
+    """
+    lock_path = json_file_path + '.lock'
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    if fcntl is None:
+        with FileLock(lock_path, timeout=-1 if timeout is None else timeout):
+            yield
+        return
+    deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if deadline is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() > deadline:
+                            raise Timeout(lock_path)
+                        time.sleep(0.05)
+            try:
+                is_current = os.fstat(fd).st_ino == os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                is_current = False
+            if is_current:
+                try:
+                    yield
+                finally:
+                    if remove:
+                        os.remove(lock_path)
+                return
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+
+@contextmanager
+def open_atomically(file_path: str, mode: str = 'w', **kwargs) -> Iterator[IO]:
+    """Open a temporary file that replaces the given file only once it is fully written"""
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)),
+        prefix=f'.{os.path.basename(file_path)}.', suffix='.tmp'
+    )
+    try:
+        # temporary files are private, give the final file the usual permissions instead
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def export_json_file_atomically(
+        data: dict | list, json_file_path: str,
+) -> None:
+    """Export the JSON file as a whole, replacing any existing file only once it is fully written"""
+    with open_atomically(json_file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+
+# suffix of the JSONL shards still being written
+UNSEALED_SHARD_SUFFIX = '.part'
+
+
+def get_jsonl_shard_dir(json_file_path: str) -> str:
+    """Directory holding the JSONL shards appended for a JSON array file"""
+    return os.path.abspath(json_file_path) + '.shards'
+
+
+class JSONLShardWriter:
+    """Append-only writer of the records of a JSON array file, as a JSONL shard of its own
+
+    Records are buffered and appended in batches, so each append is O(1) and parallel writers of the
+    same JSON file never wait for each other. The shard is written under a ".part" name and sealed by
+    close(); only sealed shards are compacted into the JSON file by compact_jsonl_shards, so compaction
+    never takes records from a writer that may still append to them.
+    """
+
+    def __init__(self, json_file_path: str, buffer_size: int = 64) -> None:
+        self.json_file_path = json_file_path
+        self.buffer_size = buffer_size
+        self.shard_dir = get_jsonl_shard_dir(json_file_path)
+        # shards are named by creation time, so that compaction keeps the order in which they were written
+        self.shard_path = os.path.join(
+            self.shard_dir, f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl')
+        self._unsealed_shard_path = self.shard_path + UNSEALED_SHARD_SUFFIX
+        self._buffer: List[str] = []
+
+    def append(self, record: Any) -> None:
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        while True:
+            try:
+                f = open(self._unsealed_shard_path, 'a', encoding='utf-8')
+                break
+            except FileNotFoundError:
+                # the shard directory is removed by compaction once it is empty
+                os.makedirs(self.shard_dir, exist_ok=True)
+        with f:
+            f.write('\n'.join(self._buffer) + '\n')
+        self._buffer.clear()
+
+    def close(self) -> None:
+        """Flush the buffered records and seal the shard, which is not appended to anymore"""
+        self.flush()
+        if os.path.isfile(self._unsealed_shard_path):
+            os.replace(self._unsealed_shard_path, self.shard_path)
+
+    def __enter__(self) -> 'JSONLShardWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _list_jsonl_shards(json_file_path: str, include_unsealed: bool) -> List[str]:
+    """Paths of the JSONL shards of a JSON array file, in the order they were written"""
+    shard_dir = get_jsonl_shard_dir(json_file_path)
+    if not os.path.isdir(shard_dir):
+        return []
+    suffixes = ('.jsonl', '.jsonl' + UNSEALED_SHARD_SUFFIX) if include_unsealed else ('.jsonl',)
+    return [os.path.join(shard_dir, f) for f in sorted(os.listdir(shard_dir)) if f.endswith(suffixes)]
+
+
+def _read_jsonl_shards(shard_paths: List[str]) -> List[Any]:
+    records = []
+    for shard_path in shard_paths:
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # a partially written last line (e.g., of a killed worker) is skipped
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f'Skipping invalid JSONL line in {shard_path}')
+    return records
+
+
+def load_jsonl_shards(json_file_path: str, include_unsealed: bool = True) -> List[Any]:
+    """Load the records of the JSONL shards of a JSON array file, in the order they were written
+
+    By default, the shards still (or, for killed writers, forever) being written are loaded as well.
+    """
+    return _read_jsonl_shards(_list_jsonl_shards(json_file_path, include_unsealed))
+
+
+def compact_jsonl_shards(
+        json_file_path: str,
+        lock_timeout: Optional[float] = None,
+        sort_key: Optional[Callable[[Any], Any]] = None,
+        include_unsealed: bool = False,
+) -> int:
+    """Append the records of the sealed JSONL shards to the JSON array file and remove these shards
+
+    The result is the same as appending the records one by one with export_dict_as_json_file, unless
+    a sort key is given to (stably) sort the whole array, e.g., for records written in completion order.
+    Only the shard files read are removed, so writers may keep writing while compacting. Include the
+    unsealed shards only when no writer is left, e.g., to recover those of killed writers. The shard
+    directory, once empty, and the lock file are removed as well.
+    Returns the number of compacted records.
+    """
+    with lock_json_file(json_file_path, lock_timeout, remove=True):
+        shard_paths = _list_jsonl_shards(json_file_path, include_unsealed)
+        records = _read_jsonl_shards(shard_paths)
+        if records:
+            json_data = []
+            if os.path.isfile(json_file_path) and os.path.getsize(json_file_path) > 0:
+                json_data = load_json_file_as_dict(json_file_path, is_strict=True)
+                if not isinstance(json_data, list):
+                    raise ValueError(f'Invalid JSON format in {json_file_path}')
+            json_data += records
+            if sort_key is not None:
+                json_data.sort(key=sort_key)
+            export_json_file_atomically(json_data, json_file_path)
+        for shard_path in shard_paths:
+            os.remove(shard_path)
+        try:
+            os.rmdir(get_jsonl_shard_dir(json_file_path))
+        except OSError:
+            # missing, or still holding the shards of other writers
+            pass
+    return len(records)
+
+
+def remove_jsonl_shards(json_file_path: str) -> None:
+    """Remove the (stale) JSONL shards of a JSON array file"""
+    shutil.rmtree(get_jsonl_shard_dir(json_file_path), ignore_errors=True)
+
+
 def confirm_overwrite_file(file_path: str | Path) -> bool:
     """Check if the file exists and ask for confirmation"""
     if os.path.isfile(file_path):
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class LLMResponseCache:
+    """Content-addressed on-disk cache of LLM responses, stored in SQLite
+
+    Responses are keyed by a hash of the backend, model, full prompt and sampling parameters, so a rerun
+    sending the same requests reads them from disk instead of querying the LLM again. Once the responses
+    exceed max_bytes, the least recently used ones are evicted. The cache can be shared by threads and
+    (through SQLite locking) by processes.
+    """
+
+    def __init__(self, cache_path: str | Path, max_bytes: int = 2 ** 30) -> None:
+        self.cache_path = str(cache_path)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, response TEXT NOT NULL, n_bytes INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        # size of the cached responses as seen by this process, recounted before evicting
+        self._n_bytes = self._count_bytes()
+        self.n_hits = self.n_misses = self.n_bypasses = 0
+
+    @staticmethod
+    def make_key(
+            llm_backend: str, llm_model: str, request_text: str, sampling_params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Hash of a request, the sampling parameters being those sent with it (none for server defaults)"""
+        canonical = json.dumps([llm_backend, llm_model, request_text, sampling_params or {}], sort_keys=True)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response of a request key, or None (counted as a miss)"""
+        with self._lock:
+            row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.n_misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.n_hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """Cache (or replace) the response of a request key, evicting old responses beyond max_bytes"""
+        n_bytes = len(response.encode('utf-8'))
+        with self._lock:
+            # the size of a replaced response is read and released in the same transaction
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT n_bytes FROM responses WHERE key = ?', (key,)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, response, n_bytes, last_access) VALUES (?, ?, ?, ?)',
+                    (key, response, n_bytes, time.time())
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._n_bytes += n_bytes - (row[0] if row is not None else 0)
+            if self._n_bytes > self.max_bytes:
+                self._evict()
+
+    def record_bypass(self) -> None:
+        """Count a request sent without looking up the cache (e.g., a retry that needs a fresh sample)"""
+        with self._lock:
+            self.n_bypasses += 1
+
+    def _count_bytes(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(n_bytes), 0) FROM responses').fetchone()[0]
+
+    def _evict(self) -> None:
+        self._n_bytes = self._count_bytes()
+        while self._n_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT key, n_bytes FROM responses ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                break
+            evicted_keys = []
+            for key, n_bytes in rows:
+                if self._n_bytes <= self.max_bytes:
+                    break
+                evicted_keys.append((key,))
+                self._n_bytes -= n_bytes
+            self._conn.executemany('DELETE FROM responses WHERE key = ?', evicted_keys)
+
+    def summarize(self) -> str:
+        n_lookups = self.n_hits + self.n_misses
+        return (f'LLM response cache: {self.n_hits} hit(s), {self.n_misses} miss(es), '
+                f'{self.n_bypasses} bypass(es), hit rate {self.n_hits / n_lookups if n_lookups else 0:.1%}')
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
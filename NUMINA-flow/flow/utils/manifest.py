@@ -0,0 +1,88 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .io import export_json_file_atomically, load_json_file_as_dict
+
+
+def hash_file(file_path: str | Path, chunk_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_file(file_path: str | Path) -> Dict[str, int | str]:
+    """Record the size, modification time and content hash of a file"""
+    stat = os.stat(file_path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hash_file(file_path),
+    }
+
+
+def is_fingerprint_matched(file_path: str | Path, fingerprint: Dict[str, int | str]) -> bool:
+    """Check whether a file still matches its recorded fingerprint"""
+    if not os.path.isfile(file_path):
+        return False
+    stat = os.stat(file_path)
+    if stat.st_size != fingerprint['size']:
+        return False
+    # unchanged modification time is trusted, otherwise fall back to comparing the content
+    return stat.st_mtime_ns == fingerprint['mtime_ns'] or hash_file(file_path) == fingerprint['sha256']
+
+
+class SceneManifest:
+    """Per-scene records of the inputs, analyzer version and outputs of past scene analyses"""
+
+    def __init__(self, manifest_dir: str | Path) -> None:
+        self.manifest_dir = Path(manifest_dir)
+
+    def _entry_path(self, scene_id: str) -> Path:
+        return self.manifest_dir / f'{scene_id}.json'
+
+    def load(self, scene_id: str) -> Optional[dict]:
+        """Load the manifest entry of a scene, if any"""
+        entry_path = self._entry_path(scene_id)
+        if not entry_path.is_file():
+            return None
+        return load_json_file_as_dict(str(entry_path)) or None
+
+    def is_up_to_date(
+            self, scene_id: str,
+            input_paths: List[str | Path], output_paths: List[str | Path],
+            version: Dict[str, str]
+    ) -> bool:
+        """Check whether a scene was analyzed from the same inputs with the same analyzer version"""
+        entry = self.load(scene_id)
+        if entry is None or entry.get('version') != version:
+            return False
+        if sorted(entry.get('outputs', [])) != sorted(os.path.basename(p) for p in output_paths):
+            return False
+        if not all(os.path.isfile(p) for p in output_paths):
+            return False
+        inputs = entry.get('inputs', {})
+        return (sorted(inputs) == sorted(os.path.basename(p) for p in input_paths) and
+                all(is_fingerprint_matched(p, inputs[os.path.basename(p)]) for p in input_paths))
+
+    @staticmethod
+    def fingerprint_inputs(input_paths: List[str | Path]) -> Dict[str, Dict[str, int | str]]:
+        """Fingerprint the input files of a scene"""
+        return {os.path.basename(p): fingerprint_file(p) for p in input_paths}
+
+    def record(
+            self, scene_id: str,
+            input_fingerprints: Dict[str, Dict[str, int | str]], output_paths: List[str | Path],
+            version: Dict[str, str]
+    ) -> None:
+        """Record a finished scene analysis"""
+        export_json_file_atomically({
+            'scene_id': scene_id,
+            'version': version,
+            'inputs': input_fingerprints,
+            'outputs': [os.path.basename(p) for p in output_paths],
+        }, str(self._entry_path(scene_id)))
@@ -1,3 +1,6 @@
+from collections import defaultdict
+from typing import Any, Dict, List
+
 from joblib import Parallel
 from tqdm.auto import tqdm
 
@@ -100,3 +103,32 @@ class ParallelTqdm(Parallel):
             self.progress_bar.refresh()
         # update progressbar
         self.progress_bar.update(self.n_completed_tasks - self.progress_bar.n)
+
+
+def summarize_worker_utilisation(task_records: List[Dict[str, Any]], wall_time: float) -> str:
+    """Summarize per-worker busy time and utilisation of a parallel run
+
+    Each task record holds the "worker" (e.g., process ID) that ran the task and its
+    "start_time" / "end_time" timestamps. The tail is the time between the first worker
+    finishing its last task and the end of the run.
+    """
+    worker_records = defaultdict(list)
+    for record in task_records:
+        worker_records[record['worker']].append(record)
+    if not worker_records or wall_time <= 0:
+        return 'No tasks recorded.'
+
+    run_start = min(record['start_time'] for record in task_records)
+    lines = [f'{" Worker utilisation ":=^80}',
+             f'{"worker":>10} {"tasks":>8} {"busy [s]":>12} {"last end [s]":>14} {"utilisation":>12}']
+    for worker, records in sorted(worker_records.items(), key=lambda item: str(item[0])):
+        busy_time = sum(record['end_time'] - record['start_time'] for record in records)
+        last_end = max(record['end_time'] for record in records) - run_start
+        lines.append(f'{worker:>10} {len(records):>8} {busy_time:>12.2f} {last_end:>14.2f} '
+                     f'{busy_time / wall_time:>12.1%}')
+    first_idle = min(max(record['end_time'] for record in records) for records in worker_records.values())
+    total_busy = sum(record['end_time'] - record['start_time'] for record in task_records)
+    lines.append(f'Wall time: {wall_time:.2f} s, mean utilisation: '
+                 f'{total_busy / (wall_time * len(worker_records)):.1%}, '
+                 f'tail: {run_start + wall_time - first_idle:.2f} s')
+    return '\n'.join(lines)
@@ -0,0 +1,73 @@
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+from plyfile import PlyData
+
+# PLY scalar property types and their NumPy equivalents
+PLY_SCALAR_DTYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+PLY_BYTE_ORDERS = {'binary_little_endian': '<', 'binary_big_endian': '>'}
+
+
+def _parse_ply_header(ply_path: str | Path) -> tuple[str, list[tuple[str, int, list]], int]:
+    """Parse the PLY header into its format, elements (name, count, properties) and byte size"""
+    elements = []
+    with open(ply_path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise ValueError(f'Invalid PLY file: {ply_path}')
+        ply_format = None
+        for line in f:
+            tokens = line.decode('ascii').split()
+            if not tokens or tokens[0] in ('comment', 'obj_info'):
+                continue
+            if tokens[0] == 'format':
+                ply_format = tokens[1]
+            elif tokens[0] == 'element':
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == 'property':
+                # list properties are kept as their full declaration, scalar ones as (name, type)
+                elements[-1][2].append((tokens[-1], tokens[1] if tokens[1] != 'list' else tokens[1:-1]))
+            elif tokens[0] == 'end_header':
+                return ply_format, elements, f.tell()
+    raise ValueError(f'Missing "end_header" in PLY file: {ply_path}')
+
+
+def count_ply_vertices(ply_path: str | Path) -> int:
+    """Count the vertices of a PLY file from its header"""
+    _, elements, _ = _parse_ply_header(ply_path)
+    return next((count for name, count, _ in elements if name == 'vertex'), 0)
+
+
+def read_ply_vertices(ply_path: str | Path) -> np.ndarray:
+    """Read the vertex element of a PLY file as a NumPy structured array
+
+    For binary files with the vertex element first and only scalar vertex properties (e.g., ScanNet
+    "_vh_clean_2.ply" meshes), the vertex block is memory-mapped without copying and the face data
+    is never read. Other files (e.g., ASCII) fall back to plyfile.
+    """
+    ply_format, elements, header_size = _parse_ply_header(ply_path)
+    if (ply_format in PLY_BYTE_ORDERS and elements and elements[0][0] == 'vertex' and
+            all(isinstance(prop_type, str) for _, prop_type in elements[0][2])):
+        _, n_vertices, properties = elements[0]
+        dtype = np.dtype([
+            (name, PLY_BYTE_ORDERS[ply_format] + PLY_SCALAR_DTYPES[prop_type]) for name, prop_type in properties
+        ])
+        return np.memmap(ply_path, dtype=dtype, mode='r', offset=header_size, shape=(n_vertices,))
+    return PlyData.read(str(ply_path))['vertex'].data
+
+
+def vertex_fields_as_array(
+        vertices: np.ndarray, fields: Sequence[str] = ('x', 'y', 'z')
+) -> np.ndarray:
+    """Stack vertex properties as an (n, len(fields)) array, as a view whenever the layout allows it"""
+    return structured_to_unstructured(vertices[list(fields)])
@@ -0,0 +1,126 @@
+import csv
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+# columns of the profiling report, in order
+PROFILE_COLUMNS = [
+    'scene_id', 'task', 'stage', 'wall_time', 'peak_rss_mb', 'n_vertices', 'n_instances', 'n_pairs', 'worker'
+]
+PROFILE_REPORT_FORMATS = ['.csv', '.json']
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the peak RSS of the current process (Linux only), returns whether it was reset"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _get_peak_rss_mb() -> float:
+    """Peak RSS of the current process in MiB, since the last reset if supported"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 1024
+
+
+class StageProfiler:
+    """Record the wall time and peak RSS of the stages of a scene analysis
+
+    Counts (e.g., vertices, instances, pairs) set along the way are attached to every stage of the scene.
+    A disabled profiler records nothing and adds no overhead beyond a context manager.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.stages: List[Dict[str, Any]] = []
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        # where peak RSS cannot be reset, it is the peak of the worker process so far
+        _reset_peak_rss()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'stage': name,
+                'wall_time': time.perf_counter() - start_time,
+                'peak_rss_mb': _get_peak_rss_mb(),
+            })
+
+    def count(self, **counts: int) -> None:
+        if self.enabled:
+            self.counts.update(counts)
+
+    def to_rows(self, **columns: Any) -> List[Dict[str, Any]]:
+        """Stage records with the counts and the given columns (e.g., scene ID) attached"""
+        return [{**columns, **self.counts, **stage} for stage in self.stages]
+
+
+def export_profile_report(rows: List[Dict[str, Any]], report_path: str | Path) -> None:
+    """Export the stage records as a CSV or JSON report, by the file extension"""
+    suffix = Path(report_path).suffix.lower()
+    if suffix not in PROFILE_REPORT_FORMATS:
+        raise ValueError(f'Invalid profile report format: {suffix}. Must be one of {PROFILE_REPORT_FORMATS}')
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    rows = [{column: row.get(column) for column in PROFILE_COLUMNS} for row in rows]
+    with open(report_path, 'w', newline='') as f:
+        if suffix == '.json':
+            json.dump(rows, f, indent=4)
+        else:
+            writer = csv.DictWriter(f, fieldnames=PROFILE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def summarize_profile(rows: List[Dict[str, Any]], top_n: int = 10) -> str:
+    """Summarize the stage records as tables of the slowest scenes and of the time spent per stage"""
+    if not rows:
+        return 'No stages recorded.'
+    scene_times, scene_peaks, scene_counts = defaultdict(float), defaultdict(float), defaultdict(dict)
+    stage_times = defaultdict(list)
+    for row in rows:
+        scene_times[row['scene_id']] += row['wall_time']
+        scene_peaks[row['scene_id']] = max(scene_peaks[row['scene_id']], row['peak_rss_mb'])
+        # blocks of split scenes only count their own pairs, so the largest counts of each scene are kept
+        for key in ('n_vertices', 'n_instances', 'n_pairs'):
+            if row.get(key) is not None:
+                scene_counts[row['scene_id']][key] = max(scene_counts[row['scene_id']].get(key, 0), row[key])
+        stage_times[row['stage']].append(row['wall_time'])
+    total_time = sum(scene_times.values())
+
+    lines = [f'{f" Slowest {min(top_n, len(scene_times))} scenes ":=^80}',
+             f'{"scene":<16} {"time [s]":>10} {"peak RSS [MiB]":>15} {"vertices":>10} {"instances":>10} {"pairs":>8}']
+    for scene_id, scene_time in sorted(scene_times.items(), key=lambda item: item[1], reverse=True)[:top_n]:
+        n_vertices, n_instances, n_pairs = (
+            scene_counts[scene_id].get(key, '-') for key in ('n_vertices', 'n_instances', 'n_pairs')
+        )
+        lines.append(f'{scene_id:<16} {scene_time:>10.3f} {scene_peaks[scene_id]:>15.1f} '
+                     f'{n_vertices:>10} {n_instances:>10} {n_pairs:>8}')
+    lines += [f'{" Time per stage ":=^80}',
+              f'{"stage":<16} {"total [s]":>10} {"mean [s]":>10} {"max [s]":>10} {"share":>8}']
+    for stage, times in sorted(stage_times.items(), key=lambda item: sum(item[1]), reverse=True):
+        lines.append(f'{stage:<16} {sum(times):>10.3f} {sum(times) / len(times):>10.3f} {max(times):>10.3f} '
+                     f'{sum(times) / total_time if total_time > 0 else 0:>8.1%}')
+    return '\n'.join(lines)
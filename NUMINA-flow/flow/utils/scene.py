@@ -1,6 +1,12 @@
+import os
+import sys
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set
 
+import numpy as np
+
+from ..utils.columnar import build_distance_matrix, load_scene_stats_npz_file
 from ..utils.io import load_json_file_as_dict
 
 
@@ -42,18 +48,42 @@ class SceneInstance:
 
 
 class SceneData:
-    """Manages scene data and provides methods to query object relationships"""
+    """Manages scene data and provides methods to query object relationships
+
+    Pairwise distances are held as a symmetric distance matrix (NaN for missing pairs), so that
+    neighbour queries only look at the row of the target object, and whole-scene queries are vectorized.
+    For scene statistics holding only a neighbour graph of the pairwise distances, neighbour queries
+    consider the stored pairs only, while distances of other pairs are calculated on demand from the
+    original ScanNet scene.
+    """
 
     def __init__(self, scene_stat_json_file: str) -> None:
-        """Initialize scene data from statistics JSON file"""
-        self.scene_stat_dict = load_json_file_as_dict(scene_stat_json_file)[0]
+        """Initialize scene data from statistics JSON file (or its columnar NPZ counterpart)"""
+        if str(scene_stat_json_file).endswith('.npz'):
+            self.scene_stat_dict = load_scene_stats_npz_file(scene_stat_json_file)
+        else:
+            self.scene_stat_dict = load_json_file_as_dict(scene_stat_json_file)[0]
         self.scene_id: str = self.scene_stat_dict['scene_id']
         self.instances = [SceneInstance(**inst)
                           for inst in self.scene_stat_dict['instances']]
 
         self._instance_map = self.scene_stat_dict['instance_map']
         self._object_map = self.scene_stat_dict['object_map']
+        # indexes of the instances by label and by object ID, built once for constant-time lookups
+        self._label_to_instances: Dict[str, List[SceneInstance]] = defaultdict(list)
+        self._id_to_instance: Dict[str, SceneInstance] = {}
+        for inst in self.instances:
+            self._label_to_instances[inst.label].append(inst)
+            self._id_to_instance.setdefault(str(inst.object_id), inst)
         self._pairwise_distances = self.scene_stat_dict['pairwise_distances']
+        self._distance_graph = self.scene_stat_dict.get('pairwise_distance_graph')
+        self._distance_analyzer = None
+        self._lazy_pairwise_distances = {}
+        # dense distance matrix, with rows in the order of the object map
+        self._row_ids = np.array([int(obj_id) for obj_id in self._object_map], dtype=np.int64)
+        self._row_labels = np.array(list(self._object_map.values()), dtype=np.str_)
+        self._id_to_row: Dict[str, int] = {obj_id: row for row, obj_id in enumerate(self._object_map)}
+        self._distance_matrix = build_distance_matrix(list(self._object_map), self._pairwise_distances)
 
     @property
     def unique_labels(self) -> List[str]:
@@ -69,24 +99,43 @@ class SceneData:
         """Get all instances with given label"""
         if label not in self._instance_map:
             raise ValueError(f'Label "{label}" not found in scene')
-        return [inst for inst in self.instances if inst.label == label]
+        return list(self._label_to_instances.get(label, []))
 
     def get_instance_by_object_id(self, object_id: str | int) -> Optional[SceneInstance]:
         """Get instance with given object ID"""
         object_id = self._validate_obj_id_format(object_id)
         if object_id not in self._object_map:
             raise ValueError(f'Object ID "{object_id}" not found in scene')
-        return next((inst for inst in self.instances if inst.object_id == int(object_id)), None)
+        return self._id_to_instance.get(object_id)
 
     def get_pairwise_distance(self, obj_id1: str | int, obj_id2: str | int) -> float:
         """Get distance between two objects"""
         obj_id1 = self._validate_obj_id_format(obj_id1)
         obj_id2 = self._validate_obj_id_format(obj_id2)
         key = self._validate_distance_key(obj_id1, obj_id2)
-        if key not in self._pairwise_distances:
+        distance = self._distance_matrix[self._id_to_row[obj_id1], self._id_to_row[obj_id2]]
+        if np.isnan(distance):
+            if self._distance_graph is not None:
+                return self._calc_missing_distance(obj_id1, obj_id2, key)
             raise ValueError(
                 f'No distance found between objects {obj_id1} and {obj_id2}')
-        return self._pairwise_distances[key]
+        return float(distance)
+
+    def get_pairwise_distance_array(
+            self, obj_ids1: List[str | int], obj_ids2: List[str | int]
+    ) -> np.ndarray:
+        """Get the distances between the objects of two equally long ID lists at once
+
+        NaN for pairs without a stored distance (including pairs of the same object); distances left out
+        of a neighbour graph are not calculated.
+        """
+        rows1, rows2 = (
+            np.array([self._id_to_row[self._validate_obj_id_format(obj_id)] for obj_id in obj_ids], dtype=np.int64)
+            for obj_ids in (obj_ids1, obj_ids2)
+        )
+        if len(rows1) != len(rows2):
+            raise ValueError('Object ID lists must have the same length')
+        return self._distance_matrix[rows1, rows2]
 
     def get_obj_surroundings(
             self,
@@ -102,18 +151,13 @@ class SceneData:
 
         self._validate_obj_id(obj_id, exclude_obj_ids_set, exclude_labels_set)
 
-        surrounding_objs = []
-        for key, distance in self._pairwise_distances.items():
-            obj1, obj2 = key.split('-')
-            neighbor_id = obj2 if obj_id == obj1 else obj1
-
-            if (obj_id in (obj1, obj2) and
-                    distance <= radius and
-                    neighbor_id not in exclude_obj_ids_set and
-                    self._object_map[neighbor_id] not in exclude_labels_set):
-                surrounding_objs.append(neighbor_id)
-
-        return surrounding_objs
+        distances = self._distance_matrix[self._id_to_row[obj_id]]
+        # NaN (missing pairs and the object itself) never compares as within the radius
+        with np.errstate(invalid='ignore'):
+            mask = self._get_neighbor_mask(exclude_obj_ids_set, exclude_labels_set) & (distances <= radius)
+        rows = np.flatnonzero(mask)
+        # in ascending order of object IDs, as the pairwise distances are ordered
+        return [str(obj_id) for obj_id in np.sort(self._row_ids[rows]).tolist()]
 
     def get_obj_k_neighbors(
             self,
@@ -132,21 +176,134 @@ class SceneData:
 
         self._validate_obj_id(obj_id, exclude_obj_ids_set, exclude_labels_set)
 
-        neighbors = []
-        for key, _ in sorted(self._pairwise_distances.items(), key=lambda x: x[1]):
-            obj1, obj2 = key.split('-')
-            neighbor_id = obj2 if obj_id == obj1 else obj1
+        distances = self._distance_matrix[self._id_to_row[obj_id]]
+        rows = np.flatnonzero(self._get_neighbor_mask(exclude_obj_ids_set, exclude_labels_set) & ~np.isnan(distances))
+        if len(rows) > k:
+            # keep every candidate tied with the k-th nearest one, so that ties can be broken by object ID
+            kth_distance = distances[rows[np.argpartition(distances[rows], k - 1)[k - 1]]]
+            rows = rows[distances[rows] <= kth_distance]
+        # nearest first, ties in ascending order of object IDs
+        rows = rows[np.lexsort((self._row_ids[rows], distances[rows]))][:k]
+        return [str(obj_id) for obj_id in self._row_ids[rows].tolist()]
+
+    # batched whole-scene queries, returning arrays with one row per object in the order of object_id_array
+    @property
+    def object_id_array(self) -> np.ndarray:
+        """Object IDs (as integers) of the rows of the batched query results"""
+        return self._row_ids.copy()
+
+    @property
+    def distance_matrix(self) -> np.ndarray:
+        """Symmetric matrix of the pairwise distances in the order of object_id_array (NaN for missing pairs)"""
+        return self._distance_matrix.copy()
+
+    def get_all_k_neighbors(
+            self, k: int,
+            exclude_obj_ids: Optional[List[str | int]] = None,
+            exclude_labels: Optional[List[str]] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the k nearest neighbours of every object at once
+
+        Returns the (n_objects, k) object IDs and distances of the neighbours, nearest first (ties in
+        ascending order of object IDs), padded with -1 / NaN where fewer than k neighbours are available.
+        Row i matches get_obj_k_neighbors(object_id_array[i], ...); excluded objects are never neighbours.
+        """
+        if k < 1:
+            raise ValueError('k must be positive')
+        distances = self._get_masked_distances(exclude_obj_ids, exclude_labels)
+        # columns in ascending order of object IDs, so that a stable sort breaks ties by object ID
+        id_order = np.argsort(self._row_ids, kind='stable')
+        sorted_distances = np.where(np.isnan(distances), np.inf, distances)[:, id_order]
+        nearest_cols = np.argsort(sorted_distances, axis=1, kind='stable')[:, :k]
+        nearest_distances = np.take_along_axis(sorted_distances, nearest_cols, axis=1)
+
+        available = np.isfinite(nearest_distances)
+        neighbor_ids = np.where(available, self._row_ids[id_order][nearest_cols], -1)
+        neighbor_distances = np.where(available, nearest_distances, np.nan)
+        if neighbor_ids.shape[1] < k:
+            padding = k - neighbor_ids.shape[1]
+            neighbor_ids = np.pad(neighbor_ids, ((0, 0), (0, padding)), constant_values=-1)
+            neighbor_distances = np.pad(neighbor_distances, ((0, 0), (0, padding)), constant_values=np.nan)
+        return neighbor_ids, neighbor_distances
+
+    def get_all_surroundings(
+            self, radius: float,
+            exclude_obj_ids: Optional[List[str | int]] = None,
+            exclude_labels: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """Get the objects within the radius of every object at once
+
+        Returns an (n_objects, n_objects) boolean adjacency matrix; the nonzero columns of row i match
+        get_obj_surroundings(object_id_array[i], ...). Excluded objects are never neighbours.
+        """
+        distances = self._get_masked_distances(exclude_obj_ids, exclude_labels)
+        with np.errstate(invalid='ignore'):
+            return distances <= radius
+
+    def get_label_pair_min_distances(
+            self,
+            exclude_obj_ids: Optional[List[str | int]] = None,
+            exclude_labels: Optional[List[str]] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the minimum distance between the instances of every pair of labels
 
-            if (obj_id in (obj1, obj2) and
-                    neighbor_id not in exclude_obj_ids_set and
-                    self._object_map[neighbor_id] not in exclude_labels_set):
-                neighbors.append(neighbor_id)
-                if len(neighbors) == k:
-                    break
+        Returns the sorted labels and a symmetric (n_labels, n_labels) matrix of minimum distances. The
+        diagonal holds the minimum distance between distinct instances of the same label; NaN where no
+        pair of (non-excluded) instances has a distance.
+        """
+        distances = self._get_masked_distances(exclude_obj_ids, exclude_labels)
+        keep = self._get_neighbor_mask(self._format_obj_ids(exclude_obj_ids), set(exclude_labels or []))
+        distances, row_labels = distances[keep][:, keep], self._row_labels[keep]
 
-        return neighbors
+        labels, label_rows = np.unique(row_labels, return_inverse=True)
+        if len(labels) == 0:
+            return labels, np.empty((0, 0), dtype=np.float64)
+        # group the rows and columns by label, then reduce each block with a NaN-ignoring minimum
+        order = np.argsort(label_rows, kind='stable')
+        starts = np.searchsorted(label_rows[order], np.arange(len(labels)))
+        with np.errstate(invalid='ignore'):
+            min_distances = np.fmin.reduceat(distances[order][:, order], starts, axis=0)
+            min_distances = np.fmin.reduceat(min_distances, starts, axis=1)
+        return labels, min_distances
 
     # helper methods
+    def _format_obj_ids(self, obj_ids: Optional[List[str | int]]) -> Set[str]:
+        return {self._validate_obj_id_format(obj_id) for obj_id in (obj_ids or [])}
+
+    def _get_masked_distances(
+            self, exclude_obj_ids: Optional[List[str | int]], exclude_labels: Optional[List[str]]
+    ) -> np.ndarray:
+        """Copy of the distance matrix with the columns of excluded objects set to NaN"""
+        mask = self._get_neighbor_mask(self._format_obj_ids(exclude_obj_ids), set(exclude_labels or []))
+        return np.where(mask[None, :], self._distance_matrix, np.nan)
+
+    def _get_neighbor_mask(self, exclude_obj_ids: Set[str], exclude_labels: Set[str]) -> np.ndarray:
+        """Boolean mask over the distance matrix rows of the objects that are not excluded"""
+        mask = (
+            ~np.isin(self._row_labels, list(exclude_labels)) if exclude_labels else
+            np.ones(len(self._row_ids), dtype=bool)
+        )
+        mask[[self._id_to_row[obj_id] for obj_id in exclude_obj_ids if obj_id in self._id_to_row]] = False
+        return mask
+
+    def _calc_missing_distance(self, obj_id1: str, obj_id2: str, key: str) -> float:
+        """Calculate a distance left out of the neighbour graph from the original ScanNet scene"""
+        if key not in self._lazy_pairwise_distances:
+            if self._distance_analyzer is None:
+                # imported here as the analyzer is only needed for neighbour graphs
+                from ..ScanNet_scene_analyzer import ScanNetSceneAnalyzer
+                try:
+                    self._distance_analyzer = ScanNetSceneAnalyzer(
+                        self._distance_graph['scene_dir'],
+                        distance_mode=self._distance_graph['distance_mode']
+                    )
+                except FileNotFoundError as e:
+                    raise ValueError(
+                        f'No distance found between objects {obj_id1} and {obj_id2}, '
+                        f'and the ScanNet scene is not available to calculate it: {e}')
+            self._lazy_pairwise_distances[key] = self._distance_analyzer.calc_pairwise_distance(obj_id1, obj_id2)
+        return self._lazy_pairwise_distances[key]
+
     def _validate_obj_id(
             self, obj_id: str,
             exclude_obj_ids: Set[str], exclude_labels: Set[str]
@@ -179,3 +336,67 @@ class SceneData:
         if obj_id2 not in self._object_map:
             raise ValueError(f'Object ID "{obj_id2}" not found in scene')
         return f'{min(int(obj_id1), int(obj_id2))}-{max(int(obj_id1), int(obj_id2))}'
+
+
+class SceneDataRegistry:
+    """Process-wide LRU cache of SceneData, keyed by the scene statistics file path and modification time
+
+    Rule generators of the same scene share one SceneData per (worker) process instead of each parsing the
+    scene statistics again. The cache is bounded by the estimated memory of the cached scenes, and a
+    modified file is reloaded. SceneData is treated as read-only by its users.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2 ** 20) -> None:
+        self.max_bytes = max_bytes
+        self._cache: OrderedDict[str, tuple[tuple[int, int], SceneData, int]] = OrderedDict()
+        self._n_bytes = 0
+
+    @staticmethod
+    def _estimate_bytes(scene_data: SceneData, file_size: int) -> int:
+        # the parsed statistics take a few times the size of the JSON text, plus the distance matrix unless
+        # it is memory-mapped
+        distance_matrix = scene_data._distance_matrix
+        matrix_bytes = 0 if isinstance(distance_matrix, np.memmap) else distance_matrix.nbytes
+        return 4 * file_size + matrix_bytes + sys.getsizeof(scene_data.instances)
+
+    def get(self, scene_stat_json_file: str) -> SceneData:
+        """Get the SceneData of a scene statistics file, loading it if not cached or modified"""
+        path = os.path.abspath(scene_stat_json_file)
+        stat = os.stat(path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        if path in self._cache:
+            cached_key, scene_data, n_bytes = self._cache[path]
+            if cached_key == file_key:
+                self._cache.move_to_end(path)
+                return scene_data
+            self._evict(path)
+
+        scene_data = SceneData(scene_stat_json_file)
+        n_bytes = self._estimate_bytes(scene_data, stat.st_size)
+        if n_bytes <= self.max_bytes:
+            self._cache[path] = (file_key, scene_data, n_bytes)
+            self._n_bytes += n_bytes
+            # evict the least recently used scenes beyond the memory bound
+            while self._n_bytes > self.max_bytes:
+                self._evict(next(iter(self._cache)))
+        return scene_data
+
+    def _evict(self, path: str) -> None:
+        _, _, n_bytes = self._cache.pop(path)
+        self._n_bytes -= n_bytes
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._n_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+# registry shared by everything loading scene statistics in this process
+SCENE_DATA_REGISTRY = SceneDataRegistry()
+
+
+def load_scene_data(scene_stat_json_file: str) -> SceneData:
+    """Load scene data through the process-wide registry"""
+    return SCENE_DATA_REGISTRY.get(scene_stat_json_file)
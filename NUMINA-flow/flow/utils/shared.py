@@ -0,0 +1,54 @@
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# RAM-backed file system for the shared buffers, if available
+_SHARED_MEMORY_DIR = '/dev/shm'
+
+
+def get_shared_dir() -> str:
+    """Directory in which memory-mapped buffers shared between worker processes are created"""
+    return _SHARED_MEMORY_DIR if os.path.isdir(_SHARED_MEMORY_DIR) else tempfile.gettempdir()
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable handle of a read-only array in a memory-mapped file, shared by worker processes
+
+    Only the handle is pickled when passed to a worker; attaching maps the same pages without copying.
+    """
+    path: str
+    dtype: str
+    shape: tuple[int, ...]
+
+    @classmethod
+    def create(
+            cls, array: np.ndarray, shared_dir: Optional[str | Path] = None, dtype: Optional[str] = None
+    ) -> 'SharedArray':
+        """Copy an array (optionally cast to the dtype) into a new memory-mapped file"""
+        dtype = np.dtype(dtype or array.dtype)
+        fd, path = tempfile.mkstemp(suffix='.npy', dir=shared_dir or get_shared_dir())
+        os.close(fd)
+        handle = cls(path=path, dtype=dtype.str, shape=tuple(array.shape))
+        if array.size == 0:
+            return handle
+        buffer = np.memmap(path, dtype=dtype, mode='w+', shape=array.shape)
+        buffer[:] = array
+        buffer.flush()
+        del buffer
+        return handle
+
+    def attach(self) -> np.ndarray:
+        """Map the shared array read-only"""
+        if np.prod(self.shape) == 0:
+            return np.empty(self.shape, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=self.shape)
+
+    def unlink(self) -> None:
+        """Remove the backing file; processes still attached keep their mapping"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
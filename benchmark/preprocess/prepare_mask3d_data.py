@@ -3,14 +3,17 @@ import csv
 import glob
 import os
 import pprint
+import sys
 from functools import partial
 
 import mmengine
 import numpy as np
 import torch
-from plyfile import PlyData
 from tqdm import tqdm
 
+sys.path.append('.')
+from utils.pc_util import read_ply_vertices, ply_vertex_fields
+
 ids = set()
 
 
@@ -51,11 +54,9 @@ def process_per_scan(scan_id, scan_dir, out_dir, tmp_dir, apply_global_alignment
     # os.makedirs(obj_out_dir, exist_ok=True)
 
     # Load point clouds with colors
-    with open(os.path.join(scan_dir, scan_id, '%s_vh_clean_2.ply' % (scan_id)), 'rb') as f:
-        plydata = PlyData.read(f)  # elements: vertex, face
-    points = np.array([list(x) for x in plydata.elements[0]])  # [[x, y, z, r, g, b, alpha]]
-    coords = np.ascontiguousarray(points[:, :3])
-    colors = np.ascontiguousarray(points[:, 3:6])
+    vertices = read_ply_vertices(os.path.join(scan_dir, scan_id, '%s_vh_clean_2.ply' % (scan_id)))  # x, y, z, r, g, b, alpha
+    coords = np.ascontiguousarray(ply_vertex_fields(vertices, ('x', 'y', 'z')), dtype=np.float32)
+    colors = np.ascontiguousarray(ply_vertex_fields(vertices, ('red', 'green', 'blue')), dtype=np.float32)
 
     # # TODO: normalize the coords and colors
     # coords = coords - coords.mean(0)
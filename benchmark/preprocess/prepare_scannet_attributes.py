@@ -1,11 +1,13 @@
-from plyfile import PlyData
 import numpy as np
 import os
+import sys
 import json
 import torch
 from collections import defaultdict
 from tqdm import tqdm
 import argparse
+sys.path.append('.')
+from utils.pc_util import read_ply_vertices, ply_vertex_fields
 
 parser = argparse.ArgumentParser()
 
@@ -26,11 +28,7 @@ for split in ["train", "val"]:
         segs_path = os.path.join(raw_data_dir, scan_id, scan_id + '_vh_clean_2.0.010000.segs.json')
         scan_ply_path = os.path.join(raw_data_dir, scan_id, scan_id + '_vh_clean_2.labels.ply')
 
-        data = PlyData.read(scan_ply_path)
-        x = np.asarray(data.elements[0].data['x']).astype(np.float32)
-        y = np.asarray(data.elements[0].data['y']).astype(np.float32)
-        z = np.asarray(data.elements[0].data['z']).astype(np.float32)
-        pc = np.stack([x, y, z], axis=1)
+        pc = ply_vertex_fields(read_ply_vertices(scan_ply_path)).astype(np.float32)
 
         align_matrix = np.eye(4)
         with open(os.path.join(raw_data_dir, scan_id, '%s.txt'%(scan_id)), 'r') as f:
@@ -1,12 +1,14 @@
-from plyfile import PlyData
 import numpy as np
 import os
+import sys
 import json
 from pytorch3d.io import load_obj
 import torch
 from collections import defaultdict
 from tqdm import tqdm
 import mmengine
+sys.path.append('.')
+from utils.pc_util import read_ply_vertices, ply_vertex_fields
 
 data_root = '/mnt/petrelfs/share_data/huanghaifeng/maoxiaohan/ScanNet_v2'
 raw_data_dir = os.path.join(data_root, 'scans')
@@ -27,11 +29,7 @@ def process_one_scan(scan_id):
     segs_path = os.path.join(raw_data_dir, scan_id, scan_id + '_vh_clean_2.0.010000.segs.json')
     scan_ply_path = os.path.join(raw_data_dir, scan_id, scan_id + '_vh_clean_2.labels.ply')
 
-    data = PlyData.read(scan_ply_path)
-    x = np.asarray(data.elements[0].data['x']).astype(np.float32)
-    y = np.asarray(data.elements[0].data['y']).astype(np.float32)
-    z = np.asarray(data.elements[0].data['z']).astype(np.float32)
-    pc = np.stack([x, y, z], axis=1)
+    pc = ply_vertex_fields(read_ply_vertices(scan_ply_path)).astype(np.float32)
 
     axis_align_matrix = np.array(scan2axis_align[scan_id], dtype=np.float32).reshape(4, 4)
     pts = np.ones((pc.shape[0], 4), dtype=pc.dtype)
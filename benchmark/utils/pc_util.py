@@ -11,11 +11,60 @@ import torch
 
 # Point cloud IO
 import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
 from plyfile import PlyData, PlyElement
 
 # Mesh IO
 import trimesh
 
+# ----------------------------------------
+# Point Cloud IO
+# ----------------------------------------
+PLY_SCALAR_DTYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+PLY_BYTE_ORDERS = {"binary_little_endian": "<", "binary_big_endian": ">"}
+
+
+def read_ply_vertices(filename):
+    """Read the vertex element of a PLY file as a numpy structured array.
+    Binary files with the vertex element first (e.g. ScanNet _vh_clean_2.ply) are
+    memory-mapped without reading the faces; other files fall back to plyfile.
+    """
+    ply_format, elements = None, []
+    with open(filename, "rb") as f:
+        for line in f:
+            tokens = line.decode("ascii").split()
+            if not tokens:
+                continue
+            if tokens[0] == "format":
+                ply_format = tokens[1]
+            elif tokens[0] == "element":
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == "property":
+                elements[-1][2].append((tokens[-1], None if tokens[1] == "list" else tokens[1]))
+            elif tokens[0] == "end_header":
+                header_size = f.tell()
+                break
+        else:
+            raise ValueError("Invalid PLY file %s: missing end_header line" % filename)
+    if (ply_format in PLY_BYTE_ORDERS and elements and elements[0][0] == "vertex"
+            and all(prop_type is not None for _, prop_type in elements[0][2])):
+        _, num_vertices, properties = elements[0]
+        dtype = np.dtype([(name, PLY_BYTE_ORDERS[ply_format] + PLY_SCALAR_DTYPES[prop_type])
+                          for name, prop_type in properties])
+        return np.memmap(filename, dtype=dtype, mode="r", offset=header_size, shape=(num_vertices,))
+    return PlyData.read(filename)["vertex"].data
+
+
+def ply_vertex_fields(vertices, fields=("x", "y", "z")):
+    """Stack vertex properties as a N x len(fields) array (a view when possible)"""
+    return structured_to_unstructured(vertices[list(fields)])
+
+
 # ----------------------------------------
 # Point Cloud Sampling
 # ----------------------------------------